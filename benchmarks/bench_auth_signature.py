@@ -0,0 +1,42 @@
+"""Benchmark: PredictorContract auth signing throughput per ECC backend.
+
+Signs without the per-account auth cache, i.e. the cost of every cache
+miss. Backends that are not installed are skipped.
+
+Usage: python benchmarks/bench_auth_signature.py [n_signatures]
+"""
+import sys
+import time
+
+from pdr_utils.contract import PredictorContract, Web3Config
+
+PRIVATE_KEY = "0x" + "11" * 32
+
+
+class Signer(PredictorContract):
+    # only what get_auth_signature needs, no RPC
+    def __init__(self, config):  # pylint: disable=super-init-not-called
+        self.config = config
+
+
+def main():
+    n_signatures = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    for backend in ("native", "coincurve"):
+        try:
+            config = Web3Config("http://localhost:8545", PRIVATE_KEY, backend)
+        except ImportError as e:
+            print(f"{backend:>9}: not available ({e})")
+            continue
+        signer = Signer(config)
+        t0 = time.perf_counter()
+        for _ in range(n_signatures):
+            signer._sign_auth()
+        elapsed = time.perf_counter() - t0
+        print(
+            f"{backend:>9}: {n_signatures / elapsed:10.1f} signatures/s "
+            f"({elapsed / n_signatures * 1e6:8.1f} us each)"
+        )
+
+
+if __name__ == "__main__":
+    main()
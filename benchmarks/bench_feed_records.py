@@ -0,0 +1,62 @@
+"""Benchmark: memory held by discovered feeds, as the dicts returned by
+get_all_interesting_prediction_contracts vs PredictionFeed records
+streamed by iter_prediction_feeds, against a local stub subgraph.
+
+Reports the peak traced memory during the scan and what the result keeps
+alive afterwards (tracemalloc), plus the scan time.
+
+Usage: python benchmarks/bench_feed_records.py [n_contracts ...]
+"""
+import gc
+import sys
+import time
+import tracemalloc
+
+from stub_subgraph import StubSubgraph
+
+from pdr_utils.subgraph import (
+    SubgraphClient,
+    get_all_interesting_prediction_contracts,
+    iter_prediction_feeds,
+)
+
+
+def measure(scan):
+    gc.collect()
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    result = scan()
+    elapsed = time.perf_counter() - t0
+    gc.collect()
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, retained, peak
+
+
+def main():
+    sizes = [int(n) for n in sys.argv[1:]] or [5000, 20000]
+    for n_contracts in sizes:
+        stub = StubSubgraph(n_contracts)
+        server, url = stub.serve()
+        client = SubgraphClient(url, timeout=30)
+        try:
+            print(f"{n_contracts} contracts:")
+            for name, scan in (
+                ("dicts", lambda: get_all_interesting_prediction_contracts(url, client=client)),
+                ("records", lambda: {f.address: f for f in iter_prediction_feeds(url, client=client)}),
+            ):
+                result, elapsed, retained, peak = measure(scan)
+                print(
+                    f"  {name:>8}: {len(result):6d} feeds in {elapsed:6.2f}s, "
+                    f"peak {peak / 2**20:7.1f} MiB, "
+                    f"retained {retained / 2**20:7.1f} MiB "
+                    f"({retained / len(result):6.0f} B/feed)"
+                )
+                del result
+        finally:
+            client.close()
+            server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Micro-benchmark: per-contract nftData decode cost, before and after
+the precomputed keccak index in pdr_utils.subgraph.
+
+Usage: python benchmarks/bench_nft_decode.py [n_contracts] [n_nft_data]
+"""
+import sys
+import timeit
+
+from web3 import Web3
+
+from pdr_utils.subgraph import INFO_KEYS, decode_nft_data
+
+
+def legacy_decode_nft_data(nft_data):
+    # the original inner loop of get_all_interesting_prediction_contracts
+    info = dict.fromkeys(INFO_KEYS)
+    for item in nft_data:
+        for info_key in info:
+            if item["key"] == Web3.keccak(info_key.encode("utf-8")).hex():
+                info[info_key] = Web3.to_text(hexstr=item["value"])
+    return info
+
+
+def make_contracts(n_contracts, n_nft_data):
+    values = {
+        "pair": "BTC/USDT",
+        "base": "BTC",
+        "quote": "USDT",
+        "source": "binance",
+        "timeframe": "5m",
+    }
+    contracts = []
+    for i in range(n_contracts):
+        nft_data = [
+            {
+                "key": Web3.keccak(text=f"unrelated-{j}").hex(),
+                "value": Web3.to_hex(text=str(j)),
+            }
+            for j in range(n_nft_data - len(values))
+        ]
+        nft_data += [
+            {"key": Web3.keccak(text=k).hex(), "value": Web3.to_hex(text=v)}
+            for k, v in values.items()
+        ]
+        contracts.append(nft_data)
+    return contracts
+
+
+def main():
+    n_contracts = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    n_nft_data = int(sys.argv[2]) if len(sys.argv) > 2 else 25
+    contracts = make_contracts(n_contracts, n_nft_data)
+    assert all(
+        legacy_decode_nft_data(c) == decode_nft_data(c) for c in contracts[:10]
+    )
+
+    for name, fn in (("before", legacy_decode_nft_data), ("after", decode_nft_data)):
+        elapsed = min(
+            timeit.repeat(lambda: [fn(c) for c in contracts], number=1, repeat=3)
+        )
+        per_contract_us = elapsed / n_contracts * 1e6
+        print(f"{name:>6}: {per_contract_us:10.1f} us/contract")
+
+
+if __name__ == "__main__":
+    main()
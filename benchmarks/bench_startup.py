@@ -0,0 +1,159 @@
+"""Benchmark: startup cost of pdr_utils.contract.
+
+Measures the import time of pdr_utils.contract in fresh interpreters, then
+the time to construct N PredictorContracts against a local stub JSON-RPC
+endpoint that adds `latency` to every request:
+
+  eager:   construct and resolve each stake token right away, one stakeToken
+           eth_call per contract (what PredictorContract.__init__ used to do)
+  lazy:    construct only, the stake token is resolved on first use
+  batched: construct, then load_stake_tokens() in one Multicall request
+
+Usage: python benchmarks/bench_startup.py [n_contracts] [latency_ms]
+"""
+import json
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from eth_abi import decode, encode
+
+from pdr_utils.constants import MULTICALL3_ADDRESS
+from pdr_utils.contract import PredictorContract, Web3Config, load_stake_tokens
+
+STAKE_TOKEN = "0x" + "5a" * 20
+AGGREGATE3_SELECTOR = "0x82ad56cb"
+IMPORT_RUNS = 5
+
+IMPORT_SNIPPET = """
+import sys, time
+t0 = time.perf_counter()
+import pdr_utils.contract
+elapsed = time.perf_counter() - t0
+print(elapsed, "sapphire_wrapper" in sys.modules, "artifacts" in sys.modules)
+"""
+
+
+class StubRPC:
+    """Answers stakeToken calls, directly or through Multicall3 aggregate3."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.n_requests = 0
+
+    def result(self, method, params):
+        if method == "eth_getCode":
+            return "0x01" if params[0].lower() == MULTICALL3_ADDRESS.lower() else "0x"
+        if method == "eth_chainId":
+            return "0x539"
+        if method != "eth_call":
+            raise ValueError(f"Unsupported method {method}")
+        data = params[0]["data"]
+        stake_token = encode(["address"], [STAKE_TOKEN])
+        if not data.startswith(AGGREGATE3_SELECTOR):
+            return "0x" + stake_token.hex()
+        (calls,) = decode(["(address,bool,bytes)[]"], bytes.fromhex(data[10:]))
+        return "0x" + encode(["(bool,bytes)[]"], [[(True, stake_token)] * len(calls)]).hex()
+
+    def serve(self):
+        """Starts serving on an ephemeral port; returns (server, url)."""
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            wbufsize = 1 << 16  # one write per response, no delayed-ACK stalls
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                time.sleep(stub.latency)
+                stub.n_requests += 1
+                response = {"jsonrpc": "2.0", "id": body["id"]}
+                try:
+                    response["result"] = stub.result(body["method"], body["params"])
+                except ValueError as e:
+                    response["error"] = {"code": -32601, "message": str(e)}
+                data = json.dumps(response).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def bench_import():
+    runs = []
+    for _ in range(IMPORT_RUNS):
+        output = subprocess.run(
+            [sys.executable, "-c", IMPORT_SNIPPET],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.split()
+        runs.append(float(output[0]))
+    print(
+        f"import pdr_utils.contract: {statistics.median(runs) * 1000:8.1f} ms median "
+        f"of {IMPORT_RUNS} (sapphire_wrapper loaded: {output[1]}, "
+        f"artifacts loaded: {output[2]})"
+    )
+
+
+def addresses(n_contracts):
+    return ["0x%040x" % (i + 1) for i in range(n_contracts)]
+
+
+def bench_construction(url, stub, n_contracts):
+    def run(name, build):
+        config = Web3Config(url, None)
+        n_requests = stub.n_requests
+        t0 = time.perf_counter()
+        build(config)
+        elapsed = time.perf_counter() - t0
+        print(
+            f"{name:>8}: {elapsed * 1000:9.1f} ms, "
+            f"{stub.n_requests - n_requests:5d} requests"
+        )
+
+    def eager(config):
+        for address in addresses(n_contracts):
+            PredictorContract(config, address).token  # pylint: disable=expression-not-assigned
+
+    def lazy(config):
+        for address in addresses(n_contracts):
+            PredictorContract(config, address)
+
+    def batched(config):
+        contracts = [PredictorContract(config, a) for a in addresses(n_contracts)]
+        load_stake_tokens(config, contracts)
+        for contract in contracts:
+            contract.token  # pylint: disable=pointless-statement
+
+    run("eager", eager)
+    run("lazy", lazy)
+    run("batched", batched)
+
+
+def main():
+    n_contracts = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    latency = float(sys.argv[2]) / 1000 if len(sys.argv) > 2 else 0.02
+    bench_import()
+    stub = StubRPC(latency)
+    server, url = stub.serve()
+    print(f"{n_contracts} contracts, {latency * 1000:.0f} ms per request:")
+    try:
+        bench_construction(url, stub, n_contracts)
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""Benchmark: sequential vs concurrent (asyncio) contract discovery
+against a local stub subgraph with a fixed per-request latency.
+
+Usage: python benchmarks/bench_subgraph_async.py [n_contracts] [latency_s]
+"""
+import asyncio
+import sys
+import time
+
+from stub_subgraph import StubSubgraph
+
+from pdr_utils.subgraph import SubgraphClient, get_all_interesting_prediction_contracts
+from pdr_utils.subgraph_async import (
+    AsyncSubgraphClient,
+    get_all_interesting_prediction_contracts_async,
+)
+
+
+async def scan_async(url):
+    async with AsyncSubgraphClient(url, timeout=30) as client:
+        return await get_all_interesting_prediction_contracts_async(url, client=client)
+
+
+def main():
+    n_contracts = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.2
+    stub = StubSubgraph(n_contracts, latency=latency)
+    server, url = stub.serve()
+    try:
+        client = SubgraphClient(url, timeout=30)
+        t0 = time.perf_counter()
+        sequential = get_all_interesting_prediction_contracts(url, client=client)
+        print(f"sequential: {len(sequential):6d} feeds in {time.perf_counter() - t0:6.2f}s")
+        client.close()
+
+        t0 = time.perf_counter()
+        concurrent = asyncio.run(scan_async(url))
+        print(f"concurrent: {len(concurrent):6d} feeds in {time.perf_counter() - t0:6.2f}s")
+        assert list(concurrent) == list(sequential)
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
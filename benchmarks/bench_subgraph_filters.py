@@ -0,0 +1,81 @@
+"""Benchmark: discovering one owner's feeds for a few pairs, filtering in
+Python (old behaviour) vs server-side, against a local stub subgraph.
+
+Usage: python benchmarks/bench_subgraph_filters.py [n_contracts]
+"""
+import sys
+import time
+
+from stub_subgraph import OWNERS, StubSubgraph
+
+from pdr_utils.subgraph import (
+    INFO_KEYS_FILTER,
+    PREDICT_CONTRACTS_QUERY,
+    SubgraphClient,
+    decode_nft_data,
+    get_all_interesting_prediction_contracts,
+    paginate_subgraph,
+)
+
+OWNER = OWNERS[0]
+PAIRS = ["BTC/USDT", "ETH/USDT", "SOL/USDT"]
+
+# the old selection set: every nftData entry of every contract
+UNFILTERED_QUERY = PREDICT_CONTRACTS_QUERY.replace(
+    "nftData(where: {key_in: [%s]})" % INFO_KEYS_FILTER, "nftData"
+)
+
+
+class CountingClient(SubgraphClient):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.n_requests = 0
+        self.n_bytes = 0
+
+    def query(self, query, variables=None):
+        result = super().query(query, variables)
+        self.n_requests += 1
+        self.n_bytes += len(str(result))
+        return result
+
+
+def python_side(url, client):
+    feeds = []
+    for page in paginate_subgraph(url, UNFILTERED_QUERY, "predictContracts", None, client):
+        for contract in page:
+            if contract["token"]["nft"]["owner"]["id"] != OWNER:
+                continue
+            if decode_nft_data(contract["token"]["nft"]["nftData"])["pair"] in PAIRS:
+                feeds.append(contract["id"])
+    return feeds
+
+
+def server_side(url, client):
+    return list(
+        get_all_interesting_prediction_contracts(
+            url, pairs=",".join(PAIRS), owners=OWNER, client=client
+        )
+    )
+
+
+def main():
+    n_contracts = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    stub = StubSubgraph(n_contracts)
+    server, url = stub.serve()
+    try:
+        for name, scan in (("python-side", python_side), ("server-side", server_side)):
+            client = CountingClient(url, timeout=30)
+            t0 = time.perf_counter()
+            feeds = scan(url, client)
+            elapsed = time.perf_counter() - t0
+            print(
+                f"{name}: {len(feeds):5d} feeds, {client.n_requests:3d} requests, "
+                f"{client.n_bytes / 1e6:7.2f} MB, {elapsed:6.2f}s"
+            )
+            client.close()
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Benchmark: legacy skip/first pagination vs keyset (id_gt) pagination
+against a local stub subgraph.
+
+Usage: python benchmarks/bench_subgraph_pagination.py [n_contracts ...]
+"""
+import sys
+import time
+
+from stub_subgraph import StubSubgraph
+
+from pdr_utils.subgraph import (
+    PREDICT_CONTRACTS_QUERY,
+    SubgraphClient,
+    get_all_interesting_prediction_contracts,
+    query_subgraph,
+)
+
+# same selection set as the keyset query, paginated the old way
+LEGACY_QUERY = "{\n    predictContracts(skip:%s, first:%s)" + PREDICT_CONTRACTS_QUERY[
+    PREDICT_CONTRACTS_QUERY.index("){", PREDICT_CONTRACTS_QUERY.index("predictContracts")) + 1 :
+]
+
+
+def legacy_scan(url, client, chunk_size=1000):
+    """The original skip/first loop; returns (n_rows, page_times, error)."""
+    offset, n_rows, page_times = 0, 0, []
+    while True:
+        t0 = time.perf_counter()
+        result = query_subgraph(url, LEGACY_QUERY % (offset, chunk_size), client=client)
+        page_times.append(time.perf_counter() - t0)
+        if "errors" in result:
+            return n_rows, page_times, result["errors"][0]["message"]
+        page = result["data"]["predictContracts"]
+        if page == []:
+            return n_rows, page_times, None
+        n_rows += len(page)
+        offset += chunk_size
+
+
+def main():
+    sizes = [int(n) for n in sys.argv[1:]] or [2500, 5000, 10000, 20000]
+    for n_contracts in sizes:
+        stub = StubSubgraph(n_contracts)
+        server, url = stub.serve()
+        client = SubgraphClient(url, timeout=30)
+        try:
+            n_rows, page_times, error = legacy_scan(url, client)
+            legacy = f"{n_rows:6d} rows in {sum(page_times):6.2f}s"
+            legacy += f" (first page {page_times[0] * 1e3:5.1f}ms,"
+            legacy += f" last {page_times[-1] * 1e3:5.1f}ms)"
+            if error:
+                legacy += f" FAILED: {error}"
+
+            stub.requests = 0
+            t0 = time.perf_counter()
+            contracts = get_all_interesting_prediction_contracts(url, client=client)
+            elapsed = time.perf_counter() - t0
+            keyset = f"{len(contracts):6d} rows in {elapsed:6.2f}s"
+            keyset += f" ({elapsed / stub.requests * 1e3:5.1f}ms/page,"
+            keyset += f" {elapsed / n_contracts * 1e6:6.1f}us/contract)"
+
+            print(f"n={n_contracts}")
+            print(f"  skip/first: {legacy}")
+            print(f"  id_gt     : {keyset}")
+        finally:
+            client.close()
+            server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
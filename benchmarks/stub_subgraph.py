@@ -0,0 +1,158 @@
+"""A local, in-memory stand-in for graph-node serving `predictContracts`.
+
+It understands both the legacy `skip`/`first` query and the keyset
+(`$where` variable) queries used by pdr_utils.subgraph, including the
+`nfts(owner_in)` lookup, `token_: {nft_in}` and `nftData(key_in)`
+narrowing, `id_gte`/`id_lt` ranges, `block_gt` and `_meta { block }`.
+Like graph-node, `skip` pages are served by scanning past the skipped
+rows and `skip` is capped server-side, while `id_gt` pages seek straight
+to the cursor.
+"""
+import bisect
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from web3 import Web3
+
+MAX_SKIP = 5000  # graph-node's default GRAPH_GRAPHQL_MAX_SKIP
+PAIRS = ["BTC/USDT", "ETH/USDT", "BNB/USDT", "ADA/USDT", "SOL/USDT"]
+TIMEFRAMES = ["5m", "1h"]
+OWNERS = ["0x" + "%040x" % (i + 1) for i in range(4)]
+
+
+def make_contract(i, n_extra_nft_data=20):
+    pair = PAIRS[i % len(PAIRS)]
+    base, quote = pair.split("/")
+    values = {
+        "pair": pair,
+        "base": base,
+        "quote": quote,
+        "source": "binance",
+        "timeframe": TIMEFRAMES[(i // len(PAIRS)) % len(TIMEFRAMES)],
+    }
+    nft_data = [
+        {"key": Web3.keccak(text=f"extra-{j}").hex(), "value": "0x00"}
+        for j in range(n_extra_nft_data)
+    ]
+    nft_data += [
+        {"key": Web3.keccak(text=k).hex(), "value": Web3.to_hex(text=v)}
+        for k, v in values.items()
+    ]
+    address = "0x" + Web3.keccak(text=f"contract-{i}").hex()[-40:]
+    return {
+        "id": address,
+        "token": {
+            "id": address,
+            "name": f"Feed {i}",
+            "symbol": f"F{i}",
+            "nft": {
+                "id": "0x" + Web3.keccak(text=f"nft-{i}").hex()[-40:],
+                "owner": {"id": OWNERS[i % len(OWNERS)]},
+                "nftData": nft_data,
+            },
+        },
+        "blocksPerEpoch": "300",
+        "blocksPerSubscription": "86400",
+        "truevalSubmitTimeoutBlock": "259200",
+        "block": i + 1,
+    }
+
+
+class StubSubgraph:
+    def __init__(self, n_contracts, latency=0.0):
+        self.latency = latency  # seconds added to every response
+        self.contracts = sorted(
+            (make_contract(i) for i in range(n_contracts)), key=lambda c: c["id"]
+        )
+        self.ids = [c["id"] for c in self.contracts]
+        self.block = n_contracts
+        self.requests = 0
+
+    def add_contracts(self, n_contracts):
+        start = len(self.contracts)
+        for i in range(start, start + n_contracts):
+            contract = make_contract(i)
+            idx = bisect.bisect_left(self.ids, contract["id"])
+            self.ids.insert(idx, contract["id"])
+            self.contracts.insert(idx, contract)
+        self.block = len(self.contracts)
+
+    def page(self, query, variables):
+        self.requests += 1
+        if "_meta" in query:
+            return {"data": {"_meta": {"block": {"number": self.block}}}}
+        legacy = re.search(r"skip:\s*(\d+),\s*first:\s*(\d+)", query)
+        if legacy:
+            skip, first = int(legacy.group(1)), int(legacy.group(2))
+            if skip > MAX_SKIP:
+                return {"errors": [{"message": f"skip {skip} exceeds {MAX_SKIP}"}]}
+            rows = iter(self.contracts)
+            for _ in range(skip):  # a SQL OFFSET walks every skipped row
+                next(rows, None)
+            return {"data": {"predictContracts": [r for _, r in zip(range(first), rows)]}}
+
+        first = variables.get("first", 100)
+        where = dict(variables.get("where") or {})
+        start = max(
+            bisect.bisect_right(self.ids, where.pop("id_gt", "")),
+            bisect.bisect_left(self.ids, where.pop("id_gte", "")),
+        )
+        id_lt = where.pop("id_lt", None)
+        if query.lstrip().startswith("query Nfts"):
+            owners = set(where.get("owner_in", []))
+            nft_ids = sorted(
+                c["token"]["nft"]["id"]
+                for c in self.contracts
+                if c["token"]["nft"]["owner"]["id"] in owners
+            )
+            last_id = (variables.get("where") or {}).get("id_gt", "")
+            nft_ids = [nft_id for nft_id in nft_ids if nft_id > last_id]
+            return {"data": {"nfts": [{"id": nft_id} for nft_id in nft_ids[:first]]}}
+
+        nft_in = set(where.get("token_", {}).get("nft_in", [])) or None
+        block_gt = where.get("block_gt", -1)
+        key_in = re.search(r"nftData\(where: \{key_in: \[([^\]]*)\]", query)
+        keys = set(re.findall(r'"([^"]+)"', key_in.group(1))) if key_in else None
+        page = []
+        for contract in self.contracts[start:]:
+            if len(page) == first or (id_lt is not None and contract["id"] >= id_lt):
+                break
+            nft = contract["token"]["nft"]
+            if nft_in is not None and nft["id"] not in nft_in:
+                continue
+            if contract["block"] <= block_gt:
+                continue
+            if keys is not None:
+                nft = dict(nft, nftData=[d for d in nft["nftData"] if d["key"] in keys])
+                contract = dict(contract, token=dict(contract["token"], nft=nft))
+            page.append(contract)
+        return {"data": {"predictContracts": page}}
+
+    def serve(self):
+        """Starts serving on an ephemeral port; returns (server, url)."""
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                time.sleep(stub.latency)
+                data = json.dumps(
+                    stub.page(body["query"], body.get("variables") or {})
+                ).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server, f"http://127.0.0.1:{server.server_port}"
@@ -2,4 +2,6 @@ ZERO_ADDRESS = "0x0000000000000000000000000000000000000000"
 SAPPHIRE_TESTNET_RPC = "https://testnet.sapphire.oasis.dev"
 SAPPHIRE_TESTNET_CHAINID = 23295
 SAPPHIRE_MAINNET_RPC = "https://sapphire.oasis.io"
-SAPPHIRE_MAINNET_CHAINID = 23294
\ No newline at end of file
+SAPPHIRE_MAINNET_CHAINID = 23294
+# Multicall3 is deployed at the same address on Sapphire and most EVM chains
+MULTICALL3_ADDRESS = "0xcA11bde05977b3631167028862bE2a173976CA11"
@@ -1,7 +1,11 @@
 import json
 import os
 import glob
+import logging
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 
 from eth_account import Account
 from eth_account.signers.local import LocalAccount
@@ -11,17 +15,85 @@ from eth_keys.backends import NativeECCBackend
 from pathlib import Path
 from web3 import Web3, HTTPProvider, WebsocketProvider
 from web3.middleware import construct_sign_and_send_raw_middleware
+from eth_utils import function_abi_to_4byte_selector
+from eth_utils.abi import collapse_if_tuple
+from ens import ENS
 from os.path import expanduser
-from sapphire_wrapper import wrapper
-import artifacts  # noqa
 
-from pdr_utils.constants import ZERO_ADDRESS, SAPPHIRE_TESTNET_CHAINID, SAPPHIRE_MAINNET_CHAINID
+from pdr_utils.gas_oracle import GasOracle
+from pdr_utils.metrics import rpc_middleware
+from pdr_utils.receipt_tracker import ReceiptTracker
+from pdr_utils.rpc_pool import RPCPool
+from pdr_utils.tx_pipeline import NonceManager, TxPipeline, is_nonce_error
+from pdr_utils.constants import (
+    ZERO_ADDRESS,
+    SAPPHIRE_TESTNET_CHAINID,
+    SAPPHIRE_MAINNET_CHAINID,
+    MULTICALL3_ADDRESS,
+)
+
+logger = logging.getLogger(__name__)
+
+# "coincurve", "native" or "auto" (coincurve if installed, else native)
+ECC_BACKEND_ENV = "PDR_ECC_BACKEND"
+
+
+def get_ecc_backend(name=None):
+    """Returns the eth_keys backend used for signing.
+
+    libsecp256k1 through coincurve (pip install coincurve) is orders of
+    magnitude faster than the pure-Python native backend.
+    """
+    name = (name or os.getenv(ECC_BACKEND_ENV) or "auto").lower()
+    if name in ("auto", "coincurve"):
+        try:
+            from eth_keys.backends import CoinCurveECCBackend
+
+            return CoinCurveECCBackend()
+        except ImportError:
+            if name == "coincurve":
+                raise
+    if name in ("auto", "native"):
+        return NativeECCBackend()
+    raise ValueError(f"Unknown ECC backend: {name}")
+
+
+keys = KeyAPI(get_ecc_backend())
+
+# auth signatures are per account, not per feed: account address -> auth,
+# shared by all PredictorContracts and reissued when close to validUntil
+AUTH_SIGNATURE_VALIDITY = 3600
+AUTH_SIGNATURE_MARGIN = 300
+_auth_signatures = {}
+_auth_signatures_lock = threading.Lock()
+
+# ERC20Template3.Status
+EPOCH_STATUS_PENDING = 0
+EPOCH_STATUS_PAYING = 1
+
+
+def is_claimable(status, prediction, true_value):
+    """Whether a payout on a slot with `status` would pay something, given
+    the getPrediction result, (predictedValue, stake, predictoor, paid), and
+    the slot's trueValues for Paying slots. A failed read (None) leaves the
+    slot in: payout is a no-op on a paid or lost slot, it only costs gas."""
+    if prediction is None:
+        return True
+    if prediction[3]:
+        return False
+    if status != EPOCH_STATUS_PAYING or true_value is None:
+        return True
+    return prediction[0] == true_value
 
-keys = KeyAPI(NativeECCBackend)
 
 def is_sapphire_network(chain_id: int) -> bool:
     return chain_id in [SAPPHIRE_TESTNET_CHAINID, SAPPHIRE_MAINNET_CHAINID]
 
+
+# resultCode of the Sapphire wrapper for a transaction that was sent
+SAPPHIRE_TX_SUCCESS = 0
+
+
 def send_encrypted_tx(
     contract_instance,
     function_name,
@@ -35,6 +107,9 @@ def send_encrypted_tx(
     gasCost=0,  # in wei
     nonce=0,
 ) -> tuple:
+    # loads the wrapper's native library, only needed on Sapphire
+    from sapphire_wrapper import wrapper  # pylint: disable=import-outside-toplevel
+
     data = contract_instance.encodeABI(fn_name=function_name, args=args)
     return wrapper.send_encrypted_sapphire_tx(
         pk,
@@ -49,14 +124,45 @@ def send_encrypted_tx(
     )
 
 
+def check_encrypted_tx(res, result):
+    """Raises if send_encrypted_tx reported a failure; `result` is then the
+    wrapper's error message instead of a tx hash."""
+    if res != SAPPHIRE_TX_SUCCESS:
+        raise Exception(f"Encrypted transaction failed with status {res}: {result}")
+
+
 class Web3Config:
-    def __init__(self, rpc_url: str, private_key: str):
-        self.rpc_url = rpc_url
+    def __init__(
+        self,
+        rpc_url: str,
+        private_key: str,
+        ecc_backend=None,
+        rpc_strategy="least_latency",
+    ):
+        # signing backend, see get_ecc_backend; defaults to the module's
+        self.keys = KeyAPI(get_ecc_backend(ecc_backend)) if ecc_backend else keys
 
         if rpc_url is None:
             raise ValueError("You must set RPC_URL variable")
 
-        self.w3 = Web3(Web3.HTTPProvider(rpc_url))
+        # several endpoints, as a list or comma separated: requests are
+        # spread over them by an RPCPool (rpc_strategy, see RPCPool)
+        if isinstance(rpc_url, str):
+            rpc_url = rpc_url.split(",")
+        self.rpc_urls = [url.strip() for url in rpc_url if url.strip()]
+        if len(self.rpc_urls) > 1:
+            self.w3 = Web3(RPCPool(self.rpc_urls, strategy=rpc_strategy))
+        else:
+            self.w3 = Web3(Web3.HTTPProvider(self.rpc_urls[0]))
+        # w3.ens is rebuilt on every access unless set, and every contract
+        # instance reads it
+        self.w3.ens = ENS.from_web3(self.w3)
+        self._multicall = None
+        self._receipt_tracker = None
+        self._contract_factories = {}
+        self._tokens = {}
+        self._tokens_lock = threading.Lock()
+        self.gas_oracle = GasOracle(self.w3)
 
         if private_key is not None:
             if not private_key.startswith("0x"):
@@ -67,16 +173,101 @@ class Web3Config:
             self.w3.middleware_onion.add(
                 construct_sign_and_send_raw_middleware(self.account)
             )
+            self.nonce_manager = NonceManager(self.w3, self.owner)
+
+        # records every request while metrics are enabled, see pdr_utils.metrics
+        endpoint = self.rpc_urls[0] if len(self.rpc_urls) == 1 else "pool"
+        self.w3.middleware_onion.add(
+            rpc_middleware(endpoint, rpc_method_label), name="metrics"
+        )
+
+    @property
+    def rpc_url(self):
+        """The endpoint transactions are sent to (the pool's write endpoint)."""
+        if isinstance(self.w3.provider, RPCPool):
+            return self.w3.provider.write_endpoint.url
+        return self.rpc_urls[0]
+
+    def tx_params(self):
+        """Returns the sender and gas fee params of a transaction from this
+        account, priced by the shared gas oracle."""
+        return {"from": self.owner, **self.gas_oracle.get_fee_params()}
+
+    def transact(self, contract_function, tx_params=None):
+        """Sends a contract function call with a locally allocated nonce and
+        returns its tx hash."""
+        params = tx_params if tx_params is not None else self.tx_params()
+        if "nonce" in params:
+            return contract_function.transact(params)
+        nonce = params["nonce"] = self.nonce_manager.next_nonce()
+        try:
+            tx = contract_function.transact(params)
+        except Exception as e:
+            # gas estimation reverts too: the nonce is given back, the
+            # counter is only resynced on nonce errors
+            self.nonce_manager.failed(nonce, e)
+            raise
+        self.nonce_manager.sent(nonce)
+        return tx
+
+    def get_contract_factory(self, contract_name):
+        """Returns the w3.eth.contract class for an artifact, built once and
+        shared by all wrappers on this connection."""
+        factory = self._contract_factories.get(contract_name)
+        if factory is None:
+            factory = self.w3.eth.contract(abi=get_contract_abi(contract_name))
+            self._contract_factories[contract_name] = factory
+        return factory
+
+    def get_token(self, address):
+        """Returns the Token at `address`, one per address on this
+        connection: feeds staking the same token share it (and its
+        allowance ledger, which is keyed by spender)."""
+        address = self.w3.to_checksum_address(address)
+        with self._tokens_lock:
+            token = self._tokens.get(address)
+            if token is None:
+                token = self._tokens[address] = Token(self, address)
+            return token
+
+    @property
+    def multicall(self):
+        """The Multicall used by batch_read for this connection."""
+        if self._multicall is None:
+            self._multicall = Multicall(self)
+        return self._multicall
+
+    @property
+    def receipt_tracker(self):
+        """The ReceiptTracker following this connection's transactions."""
+        if self._receipt_tracker is None:
+            self._receipt_tracker = ReceiptTracker(self)
+        return self._receipt_tracker
+
+    def wait_for_receipt(self, tx_hash, timeout=120):
+        """Waits for a receipt through the shared receipt tracker, so that
+        concurrent waits cost one batched request per block."""
+        return self.receipt_tracker.wait(tx_hash, timeout)
 
 
 class Token:
     def __init__(self, config: Web3Config, address: str):
         self.contract_address = config.w3.to_checksum_address(address)
-        self.contract_instance = config.w3.eth.contract(
-            address=config.w3.to_checksum_address(address),
-            abi=get_contract_abi("ERC20Template3"),
+        self.contract_instance = config.get_contract_factory("ERC20Template3")(
+            address=config.w3.to_checksum_address(address)
         )
         self.config = config
+        # spender -> allowance of config.owner, tracked locally
+        self._allowances = {}
+        self._allowances_lock = threading.Lock()
+
+    # wrapper method -> contract function, for batch_read
+    READ_CALLS = {"allowance": "allowance", "balanceOf": "balanceOf"}
+
+    def read_call(self, method_name, *args):
+        """Returns the (contract_instance, fn_name, args) read that
+        `method_name` makes, so it can be batched with batch_read."""
+        return (self.contract_instance, self.READ_CALLS[method_name], args)
 
     def allowance(self, account, spender):
         return self.contract_instance.functions.allowance(account, spender).call()
@@ -85,29 +276,167 @@ class Token:
         return self.contract_instance.functions.balanceOf(account).call()
 
     def approve(self, spender, amount, wait_for_receipt=True):
-        gasPrice = self.config.w3.eth.gas_price
         # print(f"Approving {amount} for {spender} on contract {self.contract_address}")
         try:
-            tx = self.contract_instance.functions.approve(spender, amount).transact(
-                {"from": self.config.owner, "gasPrice": gasPrice}
+            tx = self.config.transact(
+                self.contract_instance.functions.approve(spender, amount)
             )
             if not wait_for_receipt:
+                self._set_tracked_allowance(spender, amount)
                 return tx
-            return self.config.w3.eth.wait_for_transaction_receipt(tx)
+            receipt = self.config.wait_for_receipt(tx)
+            if receipt["status"] == 1:
+                self._set_tracked_allowance(spender, amount)
+            else:
+                self.forget_allowance(spender)
+            return receipt
         except:
+            self.forget_allowance(spender)
             return None
 
+    def tracked_allowance(self, spender):
+        """Returns the allowance of config.owner for `spender` as tracked
+        locally, reading it from chain the first time."""
+        with self._allowances_lock:
+            if spender in self._allowances:
+                return self._allowances[spender]
+        allowance = self.allowance(self.config.owner, spender)
+        with self._allowances_lock:
+            return self._allowances.setdefault(spender, allowance)
+
+    def ensure_allowance(self, spender, amount, budget=None, wait_for_receipt=True):
+        """Approves `spender` only if the tracked allowance is below `amount`.
+
+        @param budget: if set, approve this much (at least `amount`) at once,
+            so that later calls are covered without another approve tx
+        @return: True if `amount` is covered, False if approving failed
+        """
+        if self.tracked_allowance(spender) >= amount:
+            return True
+        result = self.approve(spender, max(amount, budget or 0), wait_for_receipt)
+        if result is None:
+            return False
+        return not wait_for_receipt or result["status"] == 1
+
+    def is_allowance_tracked(self, spender):
+        with self._allowances_lock:
+            return spender in self._allowances
+
+    def seed_allowance(self, spender, amount):
+        """Records an allowance read elsewhere (e.g. with batch_read),
+        unless one is tracked already."""
+        with self._allowances_lock:
+            self._allowances.setdefault(spender, amount)
+
+    def spend_allowance(self, spender, amount):
+        """Records that `spender` pulled `amount` from config.owner."""
+        with self._allowances_lock:
+            if spender in self._allowances:
+                self._allowances[spender] = max(0, self._allowances[spender] - amount)
+
+    def forget_allowance(self, spender=None):
+        """Drops tracked allowances so they are re-read from chain."""
+        with self._allowances_lock:
+            if spender is None:
+                self._allowances.clear()
+            else:
+                self._allowances.pop(spender, None)
+
+    def _set_tracked_allowance(self, spender, amount):
+        with self._allowances_lock:
+            self._allowances[spender] = amount
+
 
 class PredictorContract:
-    def __init__(self, config: Web3Config, address: str):
+    # seconds a cached contract parameter stays valid, None = until invalidated
+    PARAM_TTLS = {
+        "secondsPerEpoch": None,
+        "stakeToken": None,
+        "trueValSubmitTimeoutEpoch": None,
+        "getFixedRates": 3600,
+    }
+
+    def __init__(self, config: Web3Config, address: str, param_ttls=None):
         self.config = config
         self.contract_address = config.w3.to_checksum_address(address)
-        self.contract_instance = config.w3.eth.contract(
-            address=config.w3.to_checksum_address(address),
-            abi=get_contract_abi("ERC20Template3"),
-        )
-        stake_token = self.get_stake_token()
-        self.token = Token(config, stake_token)
+        # web3 builds a class per abi function for each contract instance,
+        # so it is only built when the contract is first used
+        self._contract_instance = None
+        self.param_ttls = {**self.PARAM_TTLS, **(param_ttls or {})}
+        self._param_cache = {}
+        # if set, submit_prediction approves this much (wei) at once instead
+        # of each stake, and approves again only once it is used up
+        self.approval_budget = None
+        # resolved on first use, see token and load_stake_tokens
+        self._token = None
+        self._token_lock = threading.Lock()
+
+    # wrapper method -> contract function, for batch_read
+    READ_CALLS = {
+        "getid": "getId",
+        "get_current_epoch_ts": "curEpoch",
+        "get_secondsPerEpoch": "secondsPerEpoch",
+        "get_trueValSubmitTimeoutEpoch": "trueValSubmitTimeoutEpoch",
+        "get_exchanges": "getFixedRates",
+        "get_stake_token": "stakeToken",
+        "is_valid_subscription": "isValidSubscription",
+        "soonest_timestamp_to_predict": "soonestEpochToPredict",
+    }
+
+    def read_call(self, method_name, *args):
+        """Returns the (contract_instance, fn_name, args) read that
+        `method_name` makes, so it can be batched with batch_read."""
+        if method_name == "is_valid_subscription":
+            args = (self.config.owner,)
+        return (self.contract_instance, self.READ_CALLS[method_name], args)
+
+    @property
+    def contract_instance(self):
+        if self._contract_instance is None:
+            self._contract_instance = self.config.get_contract_factory(
+                "ERC20Template3"
+            )(address=self.contract_address)
+        return self._contract_instance
+
+    @property
+    def token(self):
+        """The stake Token, built on first use from the (cached) stakeToken."""
+        if self._token is None:
+            stake_token = self.get_stake_token()
+            with self._token_lock:
+                if self._token is None:
+                    self._token = self.config.get_token(stake_token)
+        return self._token
+
+    @token.setter
+    def token(self, token):
+        self._token = token
+
+    def get_param(self, fn_name):
+        """Returns a contract parameter (see PARAM_TTLS), reading it over RPC
+        only if it is not cached or its TTL expired."""
+        if self.is_param_cached(fn_name):
+            return self._param_cache[fn_name][0]
+        value = self.contract_instance.functions[fn_name]().call()
+        self.cache_param(fn_name, value)
+        return value
+
+    def cache_param(self, fn_name, value):
+        """Stores a parameter value read elsewhere, e.g. with batch_read."""
+        ttl = self.param_ttls[fn_name]
+        expires = None if ttl is None else time.monotonic() + ttl
+        self._param_cache[fn_name] = (value, expires)
+
+    def is_param_cached(self, fn_name):
+        cached = self._param_cache.get(fn_name)
+        return cached is not None and (cached[1] is None or time.monotonic() < cached[1])
+
+    def invalidate_cache(self, fn_name=None):
+        """Drops one cached parameter, or all of them if fn_name is None."""
+        if fn_name is None:
+            self._param_cache.clear()
+        else:
+            self._param_cache.pop(fn_name, None)
 
     def is_valid_subscription(self):
         return self.contract_instance.functions.isValidSubscription(
@@ -137,12 +466,22 @@ class PredictorContract:
         return bytes(myBytes32, "utf-8")
 
     def get_auth_signature(self):
-        valid_until = int(time.time()) + 3600
+        """Returns the account's auth for getAggPredval & co, reusing a
+        cached signature until it is within AUTH_SIGNATURE_MARGIN seconds
+        of its validUntil."""
+        with _auth_signatures_lock:
+            auth = _auth_signatures.get(self.config.owner)
+            if auth is None or auth["validUntil"] - time.time() < AUTH_SIGNATURE_MARGIN:
+                auth = _auth_signatures[self.config.owner] = self._sign_auth()
+            return dict(auth)
+
+    def _sign_auth(self):
+        valid_until = int(time.time()) + AUTH_SIGNATURE_VALIDITY
         message_hash = self.config.w3.solidity_keccak(
             ["address", "uint256"],
             [self.config.owner, valid_until],
         )
-        pk = keys.PrivateKey(self.config.account.key)
+        pk = self.config.keys.PrivateKey(self.config.account.key)
         prefix = "\x19Ethereum Signed Message:\n32"
         signable_hash = self.config.w3.solidity_keccak(
             ["bytes", "bytes"],
@@ -151,7 +490,7 @@ class PredictorContract:
                 self.config.w3.to_bytes(message_hash),
             ],
         )
-        signed = keys.ecdsa_sign(message_hash=signable_hash, private_key=pk)
+        signed = self.config.keys.ecdsa_sign(message_hash=signable_hash, private_key=pk)
         auth = {
             "userAddress": self.config.owner,
             "v": (signed.v + 27) if signed.v <= 1 else signed.v,
@@ -186,10 +525,9 @@ class PredictorContract:
             publishMarketFeeAmount,
             consumeMarketFeeAmount,
         ) = exchange.get_dt_price(exchange_id)
-        # approve
-        self.token.approve(self.contract_instance.address, baseTokenAmount)
+        # approve, unless the tracked allowance already covers it
+        self.token.ensure_allowance(self.contract_instance.address, baseTokenAmount)
         # buy 1 DT
-        gasPrice = self.config.w3.eth.gas_price
         provider_fees = self.get_empty_provider_fee()
         try:
             orderParams = (
@@ -214,29 +552,28 @@ class PredictorContract:
                 0,
                 ZERO_ADDRESS,
             )
-            call_params = {
-                "from": self.config.owner,
-                "gasPrice": gasPrice,
-                #                    'nonce': self.config.w3.eth.get_transaction_count(self.config.owner),
-            }
+            call_params = self.config.tx_params()
             if gasLimit is None:
                 try:
                     gasLimit = self.contract_instance.functions.buyFromFreAndOrder(
                         orderParams, freParams
                     ).estimate_gas(call_params)
                 except Exception as e:
-                    print("Estimate gas failed")
-                    print(e)
+                    logger.warning("Estimate gas failed: %s", e)
                     gasLimit = self.get_max_gas()
             call_params["gas"] = gasLimit + 1
-            tx = self.contract_instance.functions.buyFromFreAndOrder(
-                orderParams, freParams
-            ).transact(call_params)
+            tx = self.config.transact(
+                self.contract_instance.functions.buyFromFreAndOrder(
+                    orderParams, freParams
+                ),
+                call_params,
+            )
+            self.token.spend_allowance(self.contract_instance.address, baseTokenAmount)
             if not wait_for_receipt:
                 return tx
-            return self.config.w3.eth.wait_for_transaction_receipt(tx)
+            return self.config.wait_for_receipt(tx)
         except Exception as e:
-            print(e)
+            logger.error("buyFromFreAndOrder failed: %s", e)
             return None
 
     def buy_many(self, how_many, gasLimit=None, wait_for_receipt=False):
@@ -244,16 +581,16 @@ class PredictorContract:
         txs = []
         if how_many < 1:
             return
-        print(f"Buying {how_many} accesses....")
+        logger.info("Buying %s accesses....", how_many)
         for i in range(0, how_many):
             txs.append(self.buy_and_start_subscription(gasLimit, wait_for_receipt))
         return txs
 
     def get_exchanges(self):
-        return self.contract_instance.functions.getFixedRates().call()
+        return self.get_param("getFixedRates")
 
     def get_stake_token(self):
-        return self.contract_instance.functions.stakeToken().call()
+        return self.get_param("stakeToken")
 
     def get_price(self):
         fixed_rates = self.get_exchanges()
@@ -270,56 +607,190 @@ class PredictorContract:
         ) = exchange.get_dt_price(exchange_id)
         return baseTokenAmount
 
-
     def get_current_epoch(self) -> int:
         # curEpoch returns the timestamp of current candle start
         # this function returns the "epoch number" that increases by one each secondsPerEpoch seconds
-        current_epoch_ts = self.get_current_epoch_ts()
-        seconds_per_epoch = self.get_secondsPerEpoch()
-        return int(current_epoch_ts / seconds_per_epoch)
+        # computed locally from the latest block, same as curEpoch() / secondsPerEpoch
+        block_ts = self.config.w3.eth.get_block("latest")["timestamp"]
+        return block_ts // self.get_secondsPerEpoch()
 
     def get_current_epoch_ts(self) -> int:
         """returns the current candle start timestamp"""
         return self.contract_instance.functions.curEpoch().call()
 
     def get_secondsPerEpoch(self) -> int:
-        return self.contract_instance.functions.secondsPerEpoch().call()
+        return self.get_param("secondsPerEpoch")
 
     def get_agg_predval(self, timestamp):
         """check subscription"""
         if not self.is_valid_subscription():
-            print("Buying a new subscription...")
+            logger.info("Buying a new subscription...")
             self.buy_and_start_subscription(None, True)
             time.sleep(1)
         try:
-            print("Reading contract values...")
+            logger.debug("Reading contract values...")
             auth = self.get_auth_signature()
             (nom, denom) = self.contract_instance.functions.getAggPredval(
                 timestamp, auth
             ).call({"from": self.config.owner})
-            print(f" Got {nom} and {denom}")
+            logger.debug("Got %s and %s", nom, denom)
             if denom == 0:
                 return 0
             return nom / denom
         except Exception as e:
-            print("Failed to call getAggPredval")
-            print(e)
+            logger.error("Failed to call getAggPredval: %s", e)
             return None
 
+    def get_agg_predvals(self, timestamps, as_numpy=False):
+        """Batched get_agg_predval over many epoch start timestamps, see
+        get_agg_predvals_many."""
+        return get_agg_predvals_many(self.config, [self], timestamps, as_numpy)[
+            self.contract_address
+        ]
+
     def payout(self, slot, wait_for_receipt=False):
         """Claims the payout for a slot"""
-        gasPrice = self.config.w3.eth.gas_price
         try:
-            tx = self.contract_instance.functions.payout(
-                slot, self.config.owner
-            ).transact({"from": self.config.owner, "gasPrice": gasPrice})
+            tx = self.config.transact(
+                self.contract_instance.functions.payout(slot, self.config.owner)
+            )
             if not wait_for_receipt:
                 return tx
-            return self.config.w3.eth.wait_for_transaction_receipt(tx)
+            return self.config.wait_for_receipt(tx)
         except Exception as e:
-            print(e)
+            logger.error("payout failed: %s", e)
             return None
 
+    def get_claimable_slots(self, slots, predictoor=None):
+        """
+        Filters the slots on which a payout would pay something, reading all
+        the state in batches with Multicall.
+
+        A slot is claimable if predictoor submitted a prediction on it that
+        was not paid yet, and either its trueval is in and the prediction
+        was right, it was canceled, or the trueval submission timed out
+        (payout then cancels it and refunds). Wrong predictions pay 0.
+
+        @param slots: epoch start timestamps to check
+        @param predictoor: address to check, default this account
+        @return: list of claimable slots, in the order of `slots`
+        """
+        predictoor = predictoor or self.config.owner
+        slots = list(slots)
+        if not slots:
+            return []
+        instance = self.contract_instance
+        reads = []
+        for slot in slots:
+            reads.append((instance, "submittedPredval", (slot, predictoor)))
+            reads.append((instance, "epochStatus", (slot,)))
+        results = self.config.multicall.call(reads)
+
+        seconds_per_epoch = self.get_secondsPerEpoch()
+        timeout = self.get_trueValSubmitTimeoutEpoch() * seconds_per_epoch
+        cur_epoch_ts = self.get_current_epoch() * seconds_per_epoch
+        candidates = [
+            (slot, status)
+            for slot, submitted, status in zip(slots, results[::2], results[1::2])
+            if submitted
+            and status is not None
+            and (status != EPOCH_STATUS_PENDING or cur_epoch_ts - slot >= timeout)
+        ]
+        if not candidates:
+            return []
+
+        auth = self.get_auth_signature()
+        reads = []
+        for slot, status in candidates:
+            reads.append((instance, "getPrediction", (slot, predictoor, auth)))
+            if status == EPOCH_STATUS_PAYING:
+                reads.append((instance, "trueValues", (slot,)))
+        results = iter(self.config.multicall.call(reads))
+        return [
+            slot
+            for slot, status in candidates
+            if is_claimable(
+                status,
+                next(results),
+                next(results) if status == EPOCH_STATUS_PAYING else None,
+            )
+        ]
+
+    def claim_payouts(
+        self,
+        start_ts,
+        end_ts,
+        slots_per_tx=100,
+        wait_for_receipt=True,
+    ):
+        """
+        Claims all payouts of this account over an epoch range.
+
+        Claimable slots are found with get_claimable_slots, then claimed with
+        payoutMultiple in chunks of slots_per_tx if the contract has it, else
+        one payout per slot. Transactions are sent back-to-back and their
+        receipts gathered concurrently.
+
+        @param start_ts: first epoch start timestamp (rounded up to an epoch)
+        @param end_ts: last epoch start timestamp, inclusive
+        @return: {"checked": number of slots read, "claimable": [slots],
+                  "tx_hashes": [...], "receipts": [...] (if wait_for_receipt),
+                  "failed": number of transactions that failed}
+        """
+        seconds_per_epoch = self.get_secondsPerEpoch()
+        first_slot = -(-start_ts // seconds_per_epoch) * seconds_per_epoch
+        slots = range(first_slot, end_ts + 1, seconds_per_epoch)
+        claimable = self.get_claimable_slots(slots)
+
+        pipeline = TxPipeline(self.config)
+        if claimable and self.has_function("payoutMultiple"):
+            for i in range(0, len(claimable), slots_per_tx):
+                pipeline.submit(
+                    self.payout_multiple,
+                    claimable[i : i + slots_per_tx],
+                    wait_for_receipt=False,
+                )
+        else:
+            for slot in claimable:
+                pipeline.submit(self.payout, slot, wait_for_receipt=False)
+
+        tx_hashes = list(pipeline.tx_hashes)
+        summary = {
+            "checked": len(slots),
+            "claimable": claimable,
+            "tx_hashes": tx_hashes,
+            "failed": tx_hashes.count(None),
+        }
+        if wait_for_receipt:
+            receipts = pipeline.wait_for_receipts()
+            summary["receipts"] = receipts
+            summary["failed"] = sum(
+                1 for receipt in receipts if receipt is None or receipt["status"] != 1
+            )
+        return summary
+
+    def payout_multiple(self, slots, wait_for_receipt=False):
+        """Claims the payouts of many slots in one transaction"""
+        try:
+            tx = self.config.transact(
+                self.contract_instance.functions.payoutMultiple(
+                    list(slots), self.config.owner
+                )
+            )
+            if not wait_for_receipt:
+                return tx
+            return self.config.wait_for_receipt(tx)
+        except Exception as e:
+            logger.error("payoutMultiple failed: %s", e)
+            return None
+
+    def has_function(self, fn_name):
+        """Whether the contract abi has a function named fn_name."""
+        return any(
+            abi["type"] == "function" and abi["name"] == fn_name
+            for abi in self.contract_instance.abi
+        )
+
     def soonest_timestamp_to_predict(self, timestamp):
         return self.contract_instance.functions.soonestEpochToPredict(timestamp).call()
 
@@ -345,58 +816,57 @@ class PredictorContract:
         """
         amount_wei = self.config.w3.to_wei(str(stake_amount), "ether")
 
-        # Check allowance first, only approve if needed
-        current_allowance = self.token.allowance(
-            self.config.owner, self.contract_address
-        )
-        if current_allowance < amount_wei:
-            try:
-                self.token.approve(self.contract_address, amount_wei)
-            except Exception as e:
-                print("Error while approving the contract to spend tokens:", e)
-                return None
+        # Check the tracked allowance first, only approve if needed
+        if not self.token.ensure_allowance(
+            self.contract_address, amount_wei, self.approval_budget
+        ):
+            logger.error("Error while approving the contract to spend tokens")
+            return None
 
-        self.token.approve(self.contract_address, amount_wei)
-        gasPrice = self.config.w3.eth.gas_price
         try:
             txhash = None
             if is_sapphire_network(self.config.w3.eth.chain_id):
-                data = self.contract_instance.encodeABI(
-                    fn_name="submitPredval",
-                    args=[predicted_value, amount_wei, prediction_ts],
-                )
                 sender = self.config.owner
                 receiver = self.contract_instance.address
                 pk = self.config.account.key.hex()[2:]
-                res, txhash = send_encrypted_tx(
-                    self.contract_instance,
-                    "submitPredval",
-                    [predicted_value, amount_wei, prediction_ts],
-                    pk,
-                    sender,
-                    receiver,
-                    self.config.rpc_url,
-                    0,
-                    1000000,
-                    data
-                )
-                print("Encrypted transaction status code:", res)
+                nonce = self.config.nonce_manager.next_nonce()
+                try:
+                    res, txhash = send_encrypted_tx(
+                        self.contract_instance,
+                        "submitPredval",
+                        [predicted_value, amount_wei, prediction_ts],
+                        pk,
+                        sender,
+                        receiver,
+                        self.config.rpc_url,
+                        gasLimit=1000000,
+                        nonce=nonce,
+                    )
+                    logger.info("Encrypted transaction status code: %s", res)
+                    check_encrypted_tx(res, txhash)
+                except Exception as e:
+                    self.config.nonce_manager.failed(nonce, e)
+                    raise
+                self.config.nonce_manager.sent(nonce)
             else:
-                tx = self.contract_instance.functions.submitPredval(
-                    predicted_value, amount_wei, prediction_ts
-                ).transact({"from": self.config.owner, "gasPrice": gasPrice})
+                tx = self.config.transact(
+                    self.contract_instance.functions.submitPredval(
+                        predicted_value, amount_wei, prediction_ts
+                    )
+                )
                 txhash = tx.hex()
+            self.token.spend_allowance(self.contract_address, amount_wei)
 
-            print(f"Submitted prediction, txhash: {txhash}")
+            logger.info("Submitted prediction, txhash: %s", txhash)
             if not wait_for_receipt:
                 return txhash
-            return self.config.w3.eth.wait_for_transaction_receipt(txhash)
+            return self.config.wait_for_receipt(txhash)
         except Exception as e:
-            print(e)
+            logger.error("submitPredval failed: %s", e)
             return None
 
     def get_trueValSubmitTimeoutEpoch(self):
-        return self.contract_instance.functions.trueValSubmitTimeoutEpoch().call()
+        return self.get_param("trueValSubmitTimeoutEpoch")
 
     def get_prediction(self, slot):
         return self.contract_instance.functions.getPrediction(slot).call(
@@ -406,31 +876,31 @@ class PredictorContract:
     def submit_trueval(
         self, true_val, timestamp, float_value, cancel_round, wait_for_receipt=True
     ):
-        gasPrice = self.config.w3.eth.gas_price
         try:
             fl_value = self.config.w3.to_wei(str(float_value), "ether")
-            tx = self.contract_instance.functions.submitTrueVal(
-                timestamp, true_val, fl_value, cancel_round
-            ).transact({"from": self.config.owner, "gasPrice": gasPrice})
-            print(f"Submitted trueval, txhash: {tx.hex()}")
+            tx = self.config.transact(
+                self.contract_instance.functions.submitTrueVal(
+                    timestamp, true_val, fl_value, cancel_round
+                )
+            )
+            logger.info("Submitted trueval, txhash: %s", tx.hex())
             if not wait_for_receipt:
                 return tx
-            return self.config.w3.eth.wait_for_transaction_receipt(tx)
+            return self.config.wait_for_receipt(tx)
         except Exception as e:
-            print(e)
+            logger.error("submitTrueVal failed: %s", e)
             return None
 
     def redeem_unused_slot_revenue(self, timestamp, wait_for_receipt=True):
-        gasPrice = self.config.w3.eth.gas_price
         try:
-            tx = self.contract_instance.functions.redeemUnusedSlotRevenue(
-                timestamp
-            ).transact({"from": self.config.owner, "gasPrice": gasPrice})
+            tx = self.config.transact(
+                self.contract_instance.functions.redeemUnusedSlotRevenue(timestamp)
+            )
             if not wait_for_receipt:
                 return tx
-            return self.config.w3.eth.wait_for_transaction_receipt(tx)
+            return self.config.wait_for_receipt(tx)
         except Exception as e:
-            print(e)
+            logger.error("redeemUnusedSlotRevenue failed: %s", e)
             return None
 
     def get_block(self, block):
@@ -440,9 +910,8 @@ class PredictorContract:
 class FixedRate:
     def __init__(self, config: Web3Config, address: str):
         self.contract_address = config.w3.to_checksum_address(address)
-        self.contract_instance = config.w3.eth.contract(
-            address=config.w3.to_checksum_address(address),
-            abi=get_contract_abi("FixedRateExchange"),
+        self.contract_instance = config.get_contract_factory("FixedRateExchange")(
+            address=config.w3.to_checksum_address(address)
         )
         self.config = config
 
@@ -452,6 +921,458 @@ class FixedRate:
         ).call()
 
 
+MULTICALL3_ABI = [
+    {
+        "inputs": [
+            {
+                "components": [
+                    {"name": "target", "type": "address"},
+                    {"name": "allowFailure", "type": "bool"},
+                    {"name": "callData", "type": "bytes"},
+                ],
+                "name": "calls",
+                "type": "tuple[]",
+            }
+        ],
+        "name": "aggregate3",
+        "outputs": [
+            {
+                "components": [
+                    {"name": "success", "type": "bool"},
+                    {"name": "returnData", "type": "bytes"},
+                ],
+                "name": "returnData",
+                "type": "tuple[]",
+            }
+        ],
+        "stateMutability": "payable",
+        "type": "function",
+    }
+]
+
+
+class Multicall:
+    """Aggregates many contract reads into Multicall3 aggregate3 calls.
+
+    Falls back to one eth_call per read on chains without Multicall3.
+    """
+
+    def __init__(self, config: Web3Config, address=MULTICALL3_ADDRESS, batch_size=500):
+        self.config = config
+        self.batch_size = batch_size
+        self.contract_instance = config.w3.eth.contract(
+            address=config.w3.to_checksum_address(address), abi=MULTICALL3_ABI
+        )
+        self._available = None
+
+    def is_available(self):
+        if self._available is None:
+            code = self.config.w3.eth.get_code(self.contract_instance.address)
+            self._available = len(code) > 0
+        return self._available
+
+    def call(self, reads, block_identifier="latest"):
+        """Executes [(contract_instance, fn_name, args)] reads and returns
+        their decoded results in order; failed reads give None."""
+        if not self.is_available():
+            return [self._call_one(read, block_identifier) for read in reads]
+        results = []
+        for i in range(0, len(reads), self.batch_size):
+            batch = reads[i : i + self.batch_size]
+            calls = [
+                (
+                    contract_instance.address,
+                    True,
+                    contract_instance.encodeABI(fn_name=fn_name, args=list(args)),
+                )
+                for (contract_instance, fn_name, args) in batch
+            ]
+            returned = self.contract_instance.functions.aggregate3(calls).call(
+                block_identifier=block_identifier
+            )
+            for (contract_instance, fn_name, args), (success, data) in zip(
+                batch, returned
+            ):
+                results.append(
+                    self._decode(contract_instance, fn_name, data) if success else None
+                )
+        return results
+
+    def _decode(self, contract_instance, fn_name, data):
+        abi = contract_instance.get_function_by_name(fn_name).abi
+        output_types = [collapse_if_tuple(output) for output in abi["outputs"]]
+        try:
+            values = self.config.w3.codec.decode(output_types, data)
+        except Exception:
+            return None
+        if len(values) == 1:
+            return values[0]
+        return list(values)
+
+    @staticmethod
+    def _call_one(read, block_identifier):
+        contract_instance, fn_name, args = read
+        try:
+            return contract_instance.functions[fn_name](*args).call(
+                block_identifier=block_identifier
+            )
+        except Exception:
+            return None
+
+
+def batch_read(config: Web3Config, reads):
+    """Reads many wrapper methods in as few RPC calls as possible.
+
+    @param reads: list of (wrapper, method_name, *args) where wrapper is a
+        Token or PredictorContract, e.g. (feed, "get_current_epoch_ts")
+    @return: list of results in the same order; None where a read failed
+    """
+    return config.multicall.call(
+        [wrapper.read_call(method_name, *args) for wrapper, method_name, *args in reads]
+    )
+
+
+def load_stake_tokens(config: Web3Config, contracts):
+    """Reads the stakeToken of many PredictorContracts in one batch, so that
+    their `token` is built without one RPC each."""
+    missing = [c for c in contracts if not c.is_param_cached("stakeToken")]
+    values = batch_read(config, [(c, "get_stake_token") for c in missing])
+    for contract, stake_token in zip(missing, values):
+        if stake_token:
+            contract.cache_param("stakeToken", stake_token)
+
+
+def get_current_epochs(config: Web3Config, contracts):
+    """Returns get_current_epoch() of many PredictorContracts: one batched
+    read for the secondsPerEpoch not cached yet, plus the latest block."""
+    missing = [c for c in contracts if not c.is_param_cached("secondsPerEpoch")]
+    values = batch_read(config, [(c, "get_secondsPerEpoch") for c in missing])
+    for contract, seconds_per_epoch in zip(missing, values):
+        if seconds_per_epoch:
+            contract.cache_param("secondsPerEpoch", seconds_per_epoch)
+    block_ts = config.w3.eth.get_block("latest")["timestamp"]
+    return [
+        block_ts // contract.get_secondsPerEpoch()
+        if contract.is_param_cached("secondsPerEpoch")
+        else None
+        for contract in contracts
+    ]
+
+
+def get_agg_predvals_many(
+    config: Web3Config,
+    contracts,
+    timestamps,
+    as_numpy=False,
+    buy_subscription=True,
+    chunk_size=5000,
+):
+    """
+    Reads aggregated predvals of many feeds over many epochs.
+
+    Subscriptions are checked in one batch, the account's cached auth
+    signature is reused, and the getAggPredval calls are batched with
+    Multicall.
+
+    @param contracts: list of PredictorContract
+    @param timestamps: epoch start timestamps to read
+    @param as_numpy: If True, columns are NumPy arrays (float64, NaN where a
+                     read failed) instead of lists (None where a read failed).
+    @param buy_subscription: If True, buys a subscription for feeds without one.
+
+    @return: {contract_address: {"timestamp", "nom", "denom", "ratio"}},
+             columns aligned with `timestamps`. ratio is 0 when denom is 0.
+    """
+    timestamps = list(timestamps)
+    subscribed = batch_read(config, [(c, "is_valid_subscription") for c in contracts])
+    for contract, is_subscribed in zip(contracts, subscribed):
+        if is_subscribed is None:
+            # a failed read is not a missing subscription, buying costs tokens
+            logger.warning(
+                "Reading the subscription of %s failed", contract.contract_address
+            )
+        elif not is_subscribed and buy_subscription:
+            logger.info("Buying a new subscription...")
+            contract.buy_and_start_subscription(None, True)
+
+    reads = [
+        (contract, timestamp) for contract in contracts for timestamp in timestamps
+    ]
+    results = []
+    for i in range(0, len(reads), chunk_size):
+        # cached per account, renewed only when close to expiry
+        auth = contracts[0].get_auth_signature()
+        results += config.multicall.call(
+            [
+                (contract.contract_instance, "getAggPredval", (timestamp, auth))
+                for contract, timestamp in reads[i : i + chunk_size]
+            ]
+        )
+
+    tables = {}
+    for n, contract in enumerate(contracts):
+        rows = results[n * len(timestamps) : (n + 1) * len(timestamps)]
+        tables[contract.contract_address] = agg_predvals_table(
+            timestamps, rows, as_numpy
+        )
+    return tables
+
+
+def agg_predvals_table(timestamps, rows, as_numpy=False):
+    """Builds the columns of get_agg_predvals_many from getAggPredval
+    results, (nom, denom) or None per timestamp."""
+    noms = [row[0] if row else None for row in rows]
+    denoms = [row[1] if row else None for row in rows]
+    ratios = [
+        None if row is None else (0 if row[1] == 0 else row[0] / row[1])
+        for row in rows
+    ]
+    table = {"timestamp": timestamps, "nom": noms, "denom": denoms, "ratio": ratios}
+    if as_numpy:
+        import numpy as np  # optional, only needed for as_numpy
+
+        table = {
+            "timestamp": np.array(timestamps, dtype=np.int64),
+            **{
+                column: np.array(
+                    [np.nan if v is None else float(v) for v in table[column]]
+                )
+                for column in ("nom", "denom", "ratio")
+            },
+        }
+    return table
+
+
+def submit_predictions(
+    config: Web3Config,
+    predictions,
+    wait_for_receipt=True,
+    gasLimit=1000000,
+    max_workers=16,
+    ordered_broadcast=True,
+):
+    """
+    Submits predictions to many PredictorContracts at once.
+
+    Allowances of all feeds are read in one batch and the missing approvals
+    are sent back-to-back; predictions of feeds whose approval failed are
+    skipped. Then every submitPredval is signed up front with consecutive
+    nonces and broadcast without waiting for receipts. On Sapphire the
+    wrapper signs and sends in one step, so encrypted submissions are only
+    given their nonces up front.
+
+    If a broadcast fails, the transactions signed after it would be stuck
+    behind the nonce gap: in order, the remaining ones are signed again
+    with fresh nonces; concurrently, they are already out, so the gap is
+    filled with a 0-value transfer to self (if that fails too, they are
+    reported as failed).
+
+    @param predictions: list of (PredictorContract, predicted_value, stake_amount, prediction_ts)
+    @param wait_for_receipt: If True, waits for all receipts concurrently.
+    @param gasLimit: gas limit of each submission; set explicitly so that
+                     nothing has to be estimated before the approvals are mined.
+    @param ordered_broadcast: If True, signed transactions are broadcast one
+                     after the other in nonce order. If False they are
+                     broadcast concurrently, which is faster but needs a node
+                     that queues transactions arriving with future nonces.
+
+    @return: list with, for each prediction in order, the receipt if
+             wait_for_receipt is True, else the tx hash; None where it failed.
+    """
+    if not predictions:
+        return []
+    w3 = config.w3
+    items = [
+        (contract, predicted_value, w3.to_wei(str(stake_amount), "ether"), prediction_ts)
+        for contract, predicted_value, stake_amount, prediction_ts in predictions
+    ]
+
+    # total stake per feed, allowances not tracked yet are read in one batch
+    needed = {}
+    for contract, _, amount_wei, _ in items:
+        needed[contract] = needed.get(contract, 0) + amount_wei
+    load_stake_tokens(config, list(needed))
+    unknown = [c for c in needed if not c.token.is_allowance_tracked(c.contract_address)]
+    allowances = batch_read(
+        config,
+        [(c.token, "allowance", config.owner, c.contract_address) for c in unknown],
+    )
+    for contract, allowance in zip(unknown, allowances):
+        if allowance is not None:
+            contract.token.seed_allowance(contract.contract_address, allowance)
+
+    # approve what is missing, all approvals in flight at once
+    approvals = TxPipeline(config)
+    approving = []
+    for contract, amount_wei in needed.items():
+        if contract.token.tracked_allowance(contract.contract_address) < amount_wei:
+            approving.append(contract)
+            approvals.submit(
+                contract.token.approve,
+                contract.contract_address,
+                max(amount_wei, contract.approval_budget or 0),
+                wait_for_receipt=False,
+            )
+    unapproved = set()
+    for contract, receipt in zip(approving, approvals.wait_for_receipts()):
+        if receipt is None or receipt["status"] != 1:
+            # approve() already tracked the allowance it asked for
+            logger.error(
+                "Approving %s failed, skipping its predictions",
+                contract.contract_address,
+            )
+            contract.token.forget_allowance(contract.contract_address)
+            unapproved.add(contract)
+
+    chain_id = w3.eth.chain_id
+    sapphire = is_sapphire_network(chain_id)
+    fee_params = config.tx_params()
+
+    def sign(index):
+        """Returns (index, nonce, raw_tx), raw_tx None on Sapphire; None if
+        the transaction cannot be built."""
+        contract, predicted_value, amount_wei, prediction_ts = items[index]
+        raw_tx = None
+        if not sapphire:
+            try:
+                tx = contract.contract_instance.functions.submitPredval(
+                    predicted_value, amount_wei, prediction_ts
+                ).build_transaction({**fee_params, "gas": gasLimit, "chainId": chain_id})
+            except Exception as e:
+                logger.error("Building submitPredval failed: %s", e)
+                return None
+        # nonces are only taken for transactions that will be sent
+        nonce = config.nonce_manager.next_nonce()
+        if not sapphire:
+            tx["nonce"] = nonce
+            raw_tx = config.account.sign_transaction(tx).rawTransaction
+        return (index, nonce, raw_tx)
+
+    def send(signed_item):
+        """Returns (txhash, None) or (None, the exception)."""
+        index, nonce, raw_tx = signed_item
+        contract, predicted_value, amount_wei, prediction_ts = items[index]
+        try:
+            if raw_tx is None:
+                res, txhash = send_encrypted_tx(
+                    contract.contract_instance,
+                    "submitPredval",
+                    [predicted_value, amount_wei, prediction_ts],
+                    config.account.key.hex()[2:],
+                    config.owner,
+                    contract.contract_instance.address,
+                    config.rpc_url,
+                    gasLimit=gasLimit,
+                    nonce=nonce,
+                )
+                logger.info("Encrypted transaction status code: %s", res)
+                check_encrypted_tx(res, txhash)
+            else:
+                txhash = w3.eth.send_raw_transaction(raw_tx).hex()
+        except Exception as e:
+            logger.error("submitPredval failed: %s", e)
+            return None, e
+        config.nonce_manager.sent(nonce)
+        contract.token.spend_allowance(contract.contract_address, amount_wei)
+        logger.info("Submitted prediction, txhash: %s", txhash)
+        return txhash, None
+
+    def fill_gap(nonce):
+        """Sends a 0-value transfer to self at `nonce`; returns True if sent."""
+        tx = {
+            "to": config.owner,
+            "value": 0,
+            "gas": 21000,
+            "nonce": nonce,
+            "chainId": chain_id,
+            **{k: v for k, v in fee_params.items() if k != "from"},
+        }
+        try:
+            w3.eth.send_raw_transaction(config.account.sign_transaction(tx).rawTransaction)
+        except Exception as e:
+            logger.error("Filling the gap at nonce %s failed: %s", nonce, e)
+            return False
+        config.nonce_manager.sent(nonce)
+        return True
+
+    txhashes = [None] * len(items)
+    queue = [i for i, item in enumerate(items) if item[0] not in unapproved]
+    while queue:
+        signed = [s for s in map(sign, queue) if s is not None]
+        queue = []
+        if ordered_broadcast:
+            for n, signed_item in enumerate(signed):
+                txhash, error = send(signed_item)
+                if error is None:
+                    txhashes[signed_item[0]] = txhash
+                    continue
+                # the later nonces would wait behind the gap, possibly past
+                # the epoch: give them back and sign the rest again
+                rest = signed[n + 1 :]
+                for _, nonce, _ in reversed(rest):
+                    config.nonce_manager.release(nonce)
+                config.nonce_manager.failed(signed_item[1], error)
+                queue = [index for index, _, _ in rest]
+                break
+        elif signed:
+            with ThreadPoolExecutor(min(max_workers, len(signed))) as executor:
+                outcomes = list(executor.map(send, signed))
+            gap = None
+            for (index, nonce, _), (txhash, error) in sorted(
+                zip(signed, outcomes), key=lambda outcome: outcome[0][1]
+            ):
+                if error is None:
+                    if gap is None:
+                        txhashes[index] = txhash
+                    else:
+                        logger.error(
+                            "submitPredval %s is stuck behind nonce %s", txhash, gap
+                        )
+                    continue
+                # the later nonces are out already: fill the gap so that
+                # they are mined now, not whenever the next transaction is
+                if gap is None and not is_nonce_error(error) and fill_gap(nonce):
+                    continue
+                config.nonce_manager.failed(nonce, error)
+                if gap is None and not is_nonce_error(error):
+                    gap = nonce
+
+    if not wait_for_receipt:
+        return txhashes
+    receipts = TxPipeline(config)
+    for txhash in txhashes:
+        receipts.add(txhash)
+    return receipts.wait_for_receipts()
+
+
+@lru_cache(maxsize=None)
+def _function_selectors():
+    """4-byte selector -> name of the functions the wrappers call."""
+    abis = (
+        get_contract_abi("ERC20Template3")
+        + get_contract_abi("FixedRateExchange")
+        + MULTICALL3_ABI
+    )
+    return {
+        "0x" + function_abi_to_4byte_selector(abi).hex(): abi["name"]
+        for abi in abis
+        if abi["type"] == "function"
+    }
+
+
+def rpc_method_label(method, params):
+    """Metrics label of a JSON-RPC request: the method, plus the contract
+    function for calls and transactions, e.g. "eth_call:getAggPredval"."""
+    if method in ("eth_call", "eth_estimateGas", "eth_sendTransaction") and params:
+        data = params[0].get("data") if isinstance(params[0], dict) else None
+        if data:
+            selector = data[:10] if isinstance(data, str) else "0x" + bytes(data[:4]).hex()
+            name = _function_selectors().get(selector.lower())
+            if name:
+                return f"{method}:{name}"
+    return method
+
+
 def get_contract_abi(contract_name):
     """Returns the abi for a contract name."""
     path = get_contract_filename(contract_name)
@@ -459,6 +1380,11 @@ def get_contract_abi(contract_name):
     if not path.exists():
         raise TypeError("Contract name does not exist in artifacts.")
 
+    return _load_contract_abi(path)
+
+
+@lru_cache(maxsize=None)
+def _load_contract_abi(path):
     with open(path) as f:
         data = json.load(f)
         return data["abi"]
@@ -466,16 +1392,22 @@ def get_contract_abi(contract_name):
 
 def get_contract_filename(contract_name):
     """Returns abi for a contract."""
+    return _find_contract_filename(contract_name, os.getenv("ADDRESS_FILE"))
+
+
+@lru_cache(maxsize=None)
+def _find_contract_filename(contract_name, address_filename):
     contract_basename = f"{contract_name}.json"
 
     # first, try to find locally
-    address_filename = os.getenv("ADDRESS_FILE")
     path = None
     if address_filename:
         address_dir = os.path.dirname(address_filename)
         root_dir = os.path.join(address_dir, "..")
-        os.chdir(root_dir)
-        paths = glob.glob(f"**/{contract_basename}", recursive=True)
+        paths = glob.glob(
+            os.path.join(glob.escape(root_dir), "**", contract_basename),
+            recursive=True,
+        )
         if paths:
             assert len(paths) == 1, "had duplicates for {contract_basename}"
             path = paths[0]
@@ -485,6 +1417,8 @@ def get_contract_filename(contract_name):
             ), f"Found path = '{path}' via glob, yet path.exists() is False"
             return path
     # didn't find locally, so use use artifacts lib
+    import artifacts  # pylint: disable=import-outside-toplevel
+
     path = os.path.join(os.path.dirname(artifacts.__file__), "", contract_basename)
     path = Path(path).expanduser().resolve()
     if not path.exists():
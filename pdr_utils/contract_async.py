@@ -0,0 +1,613 @@
+import asyncio
+import functools
+import logging
+import threading
+
+from eth_account import Account
+from eth_account.signers.local import LocalAccount
+from eth_keys import KeyAPI
+from ens import AsyncENS
+from web3 import AsyncWeb3, AsyncHTTPProvider
+
+from pdr_utils.gas_oracle import AsyncGasOracle
+from pdr_utils.metrics import async_rpc_middleware
+from pdr_utils.tx_pipeline import AsyncNonceManager
+from pdr_utils.contract import (
+    EPOCH_STATUS_PAYING,
+    EPOCH_STATUS_PENDING,
+    PredictorContract,
+    Token,
+    agg_predvals_table,
+    check_encrypted_tx,
+    get_contract_abi,
+    get_ecc_backend,
+    is_claimable,
+    is_sapphire_network,
+    keys,
+    rpc_method_label,
+    send_encrypted_tx,
+)
+from pdr_utils.constants import ZERO_ADDRESS
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncWeb3Config:
+    """asyncio counterpart of Web3Config on AsyncWeb3(AsyncHTTPProvider).
+
+    Transactions are built, signed locally and sent raw, with nonces from an
+    AsyncNonceManager and fees from an AsyncGasOracle, so any number of
+    tasks can send concurrently from one event loop.
+    """
+
+    def __init__(self, rpc_url: str, private_key: str, ecc_backend=None):
+        self.rpc_url = rpc_url
+        self.keys = KeyAPI(get_ecc_backend(ecc_backend)) if ecc_backend else keys
+
+        if rpc_url is None:
+            raise ValueError("You must set RPC_URL variable")
+
+        self.w3 = AsyncWeb3(AsyncHTTPProvider(rpc_url))
+        # built once instead of on every contract instance, see Web3Config
+        self.w3.ens = AsyncENS.from_web3(self.w3)
+        self._contract_factories = {}
+        self._tokens = {}
+        self._tokens_lock = None
+        self.gas_oracle = AsyncGasOracle(self.w3)
+
+        if private_key is not None:
+            if not private_key.startswith("0x"):
+                raise ValueError("Private key must start with 0x hex prefix")
+            self.account: LocalAccount = Account.from_key(private_key)
+            self.owner = self.account.address
+            self.private_key = private_key
+            self.nonce_manager = AsyncNonceManager(self.w3, self.owner)
+
+        self.w3.middleware_onion.add(
+            async_rpc_middleware(rpc_url, rpc_method_label), name="metrics"
+        )
+
+    async def tx_params(self):
+        return {"from": self.owner, **await self.gas_oracle.get_fee_params()}
+
+    async def transact(self, contract_function, tx_params=None):
+        """Builds, signs and sends a contract function call with a locally
+        allocated nonce and returns its tx hash."""
+        params = tx_params if tx_params is not None else await self.tx_params()
+        nonce = None
+        if "nonce" not in params:
+            nonce = params["nonce"] = await self.nonce_manager.next_nonce()
+        try:
+            tx = await contract_function.build_transaction(params)
+            signed = self.account.sign_transaction(tx)
+            tx_hash = await self.w3.eth.send_raw_transaction(signed.rawTransaction)
+        except Exception as e:
+            # see Web3Config.transact
+            if nonce is not None:
+                self.nonce_manager.failed(nonce, e)
+            raise
+        if nonce is not None:
+            self.nonce_manager.sent(nonce)
+        return tx_hash
+
+    async def wait_for_receipt(self, tx):
+        return await self.w3.eth.wait_for_transaction_receipt(tx)
+
+    def get_contract_factory(self, contract_name):
+        factory = self._contract_factories.get(contract_name)
+        if factory is None:
+            factory = self.w3.eth.contract(abi=get_contract_abi(contract_name))
+            self._contract_factories[contract_name] = factory
+        return factory
+
+    async def get_token(self, address):
+        """Returns the AsyncToken for `address`, one per token, so that
+        feeds sharing a stake token share its allowance ledger and locks."""
+        if self._tokens_lock is None:
+            self._tokens_lock = asyncio.Lock()
+        address = self.w3.to_checksum_address(address)
+        async with self._tokens_lock:
+            token = self._tokens.get(address)
+            if token is None:
+                token = AsyncToken(self, address)
+                self._tokens[address] = token
+            return token
+
+
+class AsyncToken:
+    """asyncio counterpart of Token; the allowance ledger is shared code."""
+
+    def __init__(self, config: AsyncWeb3Config, address: str):
+        self.contract_address = config.w3.to_checksum_address(address)
+        self.contract_instance = config.get_contract_factory("ERC20Template3")(
+            address=self.contract_address
+        )
+        self.config = config
+        self._allowances = {}
+        # only held between awaits, never across one
+        self._allowances_lock = threading.Lock()
+        # held across the check and the approve, see ensure_allowance
+        self._spender_locks = {}
+
+    # the local ledger needs no I/O, Token's methods are reused as is
+    is_allowance_tracked = Token.is_allowance_tracked
+    seed_allowance = Token.seed_allowance
+    spend_allowance = Token.spend_allowance
+    forget_allowance = Token.forget_allowance
+    _set_tracked_allowance = Token._set_tracked_allowance
+
+    async def allowance(self, account, spender):
+        return await self.contract_instance.functions.allowance(account, spender).call()
+
+    async def balanceOf(self, account):
+        return await self.contract_instance.functions.balanceOf(account).call()
+
+    async def approve(self, spender, amount, wait_for_receipt=True):
+        try:
+            tx = await self.config.transact(
+                self.contract_instance.functions.approve(spender, amount)
+            )
+            if not wait_for_receipt:
+                self._set_tracked_allowance(spender, amount)
+                return tx
+            receipt = await self.config.wait_for_receipt(tx)
+            if receipt["status"] == 1:
+                self._set_tracked_allowance(spender, amount)
+            else:
+                self.forget_allowance(spender)
+            return receipt
+        except Exception:
+            self.forget_allowance(spender)
+            return None
+
+    async def tracked_allowance(self, spender):
+        if spender in self._allowances:
+            return self._allowances[spender]
+        allowance = await self.allowance(self.config.owner, spender)
+        return self._allowances.setdefault(spender, allowance)
+
+    async def ensure_allowance(
+        self, spender, amount, budget=None, wait_for_receipt=True
+    ):
+        """See Token.ensure_allowance. Concurrent calls for one spender
+        are serialized, otherwise each would send its own approve(amount)
+        and the last one mined would overwrite the others."""
+        lock = self._spender_locks.get(spender)
+        if lock is None:
+            lock = self._spender_locks[spender] = asyncio.Lock()
+        async with lock:
+            if await self.tracked_allowance(spender) >= amount:
+                return True
+            result = await self.approve(
+                spender, max(amount, budget or 0), wait_for_receipt
+            )
+            if result is None:
+                return False
+            return not wait_for_receipt or result["status"] == 1
+
+
+class AsyncPredictorContract:
+    """asyncio counterpart of PredictorContract, with the same methods as
+    coroutines.
+
+    The stake token needs an RPC, so it is resolved on first use (or by
+    create()) instead of in __init__; use `await get_token()` or the
+    `token` attribute once resolved.
+    """
+
+    PARAM_TTLS = PredictorContract.PARAM_TTLS
+
+    def __init__(self, config: AsyncWeb3Config, address: str, param_ttls=None):
+        self.config = config
+        self.contract_address = config.w3.to_checksum_address(address)
+        self.contract_instance = config.get_contract_factory("ERC20Template3")(
+            address=self.contract_address
+        )
+        self.param_ttls = {**self.PARAM_TTLS, **(param_ttls or {})}
+        self._param_cache = {}
+        self.approval_budget = None
+        self.token = None
+        self._token_lock = None
+
+    @classmethod
+    async def create(cls, config: AsyncWeb3Config, address: str, param_ttls=None):
+        """Returns a contract whose stake token is already resolved."""
+        contract = cls(config, address, param_ttls)
+        await contract.get_token()
+        return contract
+
+    # no I/O in these, shared with PredictorContract
+    cache_param = PredictorContract.cache_param
+    is_param_cached = PredictorContract.is_param_cached
+    invalidate_cache = PredictorContract.invalidate_cache
+    get_empty_provider_fee = PredictorContract.get_empty_provider_fee
+    string_to_bytes32 = PredictorContract.string_to_bytes32
+    get_auth_signature = PredictorContract.get_auth_signature
+    _sign_auth = PredictorContract._sign_auth
+    has_function = PredictorContract.has_function
+
+    async def get_param(self, fn_name):
+        if self.is_param_cached(fn_name):
+            return self._param_cache[fn_name][0]
+        value = await self.contract_instance.functions[fn_name]().call()
+        self.cache_param(fn_name, value)
+        return value
+
+    async def get_token(self):
+        if self._token_lock is None:
+            self._token_lock = asyncio.Lock()
+        # concurrent callers wait for the first one's lookup
+        async with self._token_lock:
+            if self.token is None:
+                self.token = await self.config.get_token(await self.get_stake_token())
+        return self.token
+
+    async def _transact_and_wait(self, contract_function, wait_for_receipt):
+        try:
+            tx = await self.config.transact(contract_function)
+            if not wait_for_receipt:
+                return tx
+            return await self.config.wait_for_receipt(tx)
+        except Exception as e:
+            logger.error("Transaction failed: %s", e)
+            return None
+
+    async def is_valid_subscription(self):
+        return await self.contract_instance.functions.isValidSubscription(
+            self.config.owner
+        ).call()
+
+    async def getid(self):
+        return await self.contract_instance.functions.getId().call()
+
+    async def get_max_gas(self):
+        """Returns max block gas"""
+        block = await self.config.w3.eth.get_block("latest", full_transactions=False)
+        return int(block["gasLimit"] * 0.99)
+
+    async def buy_and_start_subscription(self, gasLimit=None, wait_for_receipt=True):
+        """Buys 1 datatoken and starts a subscription"""
+        fixed_rates = await self.get_exchanges()
+        if not fixed_rates:
+            return None
+        (fixed_rate_address, exchange_id) = fixed_rates[0]
+        exchange = AsyncFixedRate(self.config, fixed_rate_address)
+        baseTokenAmount = (await exchange.get_dt_price(exchange_id))[0]
+        token = await self.get_token()
+        await token.ensure_allowance(self.contract_address, baseTokenAmount)
+        provider_fees = self.get_empty_provider_fee()
+        try:
+            orderParams = (
+                self.config.owner,
+                0,
+                (
+                    ZERO_ADDRESS,
+                    ZERO_ADDRESS,
+                    0,
+                    0,
+                    self.string_to_bytes32(""),
+                    self.string_to_bytes32(""),
+                    provider_fees["validUntil"],
+                    self.config.w3.to_bytes(b""),
+                ),
+                (ZERO_ADDRESS, ZERO_ADDRESS, 0),
+            )
+            freParams = (
+                self.config.w3.to_checksum_address(fixed_rate_address),
+                self.config.w3.to_bytes(exchange_id),
+                baseTokenAmount,
+                0,
+                ZERO_ADDRESS,
+            )
+            function = self.contract_instance.functions.buyFromFreAndOrder(
+                orderParams, freParams
+            )
+            call_params = await self.config.tx_params()
+            if gasLimit is None:
+                try:
+                    gasLimit = await function.estimate_gas(call_params)
+                except Exception as e:
+                    logger.warning("Estimate gas failed: %s", e)
+                    gasLimit = await self.get_max_gas()
+            call_params["gas"] = gasLimit + 1
+            tx = await self.config.transact(function, call_params)
+            token.spend_allowance(self.contract_address, baseTokenAmount)
+            if not wait_for_receipt:
+                return tx
+            return await self.config.wait_for_receipt(tx)
+        except Exception as e:
+            logger.error("buyFromFreAndOrder failed: %s", e)
+            return None
+
+    async def buy_many(self, how_many, gasLimit=None, wait_for_receipt=False):
+        """Buys multiple accesses and returns tx hashes"""
+        if how_many < 1:
+            return None
+        logger.info("Buying %s accesses....", how_many)
+        # approve all the buys at once: approve sets the allowance, so
+        # concurrent buys approving one price each would fund only one
+        price = await self.get_price()
+        if price is None:
+            return [None] * how_many
+        token = await self.get_token()
+        if not await token.ensure_allowance(self.contract_address, how_many * price):
+            logger.error("Error while approving the contract to spend tokens")
+            return [None] * how_many
+        return await asyncio.gather(
+            *(
+                self.buy_and_start_subscription(gasLimit, wait_for_receipt)
+                for _ in range(how_many)
+            )
+        )
+
+    async def get_exchanges(self):
+        return await self.get_param("getFixedRates")
+
+    async def get_stake_token(self):
+        return await self.get_param("stakeToken")
+
+    async def get_price(self):
+        fixed_rates = await self.get_exchanges()
+        if not fixed_rates:
+            return None
+        (fixed_rate_address, exchange_id) = fixed_rates[0]
+        exchange = AsyncFixedRate(self.config, fixed_rate_address)
+        return (await exchange.get_dt_price(exchange_id))[0]
+
+    async def get_current_epoch(self) -> int:
+        block, seconds_per_epoch = await asyncio.gather(
+            self.config.w3.eth.get_block("latest"), self.get_secondsPerEpoch()
+        )
+        return block["timestamp"] // seconds_per_epoch
+
+    async def get_current_epoch_ts(self) -> int:
+        """returns the current candle start timestamp"""
+        return await self.contract_instance.functions.curEpoch().call()
+
+    async def get_secondsPerEpoch(self) -> int:
+        return await self.get_param("secondsPerEpoch")
+
+    async def get_trueValSubmitTimeoutEpoch(self):
+        return await self.get_param("trueValSubmitTimeoutEpoch")
+
+    async def get_agg_predval(self, timestamp):
+        if not await self.is_valid_subscription():
+            logger.info("Buying a new subscription...")
+            await self.buy_and_start_subscription(None, True)
+        try:
+            auth = self.get_auth_signature()
+            (nom, denom) = await self.contract_instance.functions.getAggPredval(
+                timestamp, auth
+            ).call({"from": self.config.owner})
+            if denom == 0:
+                return 0
+            return nom / denom
+        except Exception as e:
+            logger.error("Failed to call getAggPredval: %s", e)
+            return None
+
+    async def get_agg_predvals(self, timestamps, as_numpy=False):
+        """Reads getAggPredval over many epochs concurrently, see
+        get_agg_predvals_many for the returned columns."""
+        timestamps = list(timestamps)
+        if not await self.is_valid_subscription():
+            logger.info("Buying a new subscription...")
+            await self.buy_and_start_subscription(None, True)
+        auth = self.get_auth_signature()
+
+        async def read(timestamp):
+            try:
+                return await self.contract_instance.functions.getAggPredval(
+                    timestamp, auth
+                ).call({"from": self.config.owner})
+            except Exception:
+                return None
+
+        rows = await asyncio.gather(*(read(ts) for ts in timestamps))
+        return agg_predvals_table(timestamps, rows, as_numpy)
+
+    async def payout(self, slot, wait_for_receipt=False):
+        """Claims the payout for a slot"""
+        return await self._transact_and_wait(
+            self.contract_instance.functions.payout(slot, self.config.owner),
+            wait_for_receipt,
+        )
+
+    async def payout_multiple(self, slots, wait_for_receipt=False):
+        """Claims the payouts of many slots in one transaction"""
+        return await self._transact_and_wait(
+            self.contract_instance.functions.payoutMultiple(
+                list(slots), self.config.owner
+            ),
+            wait_for_receipt,
+        )
+
+    async def get_claimable_slots(self, slots, predictoor=None):
+        """See PredictorContract.get_claimable_slots; reads run concurrently."""
+        predictoor = predictoor or self.config.owner
+        slots = list(slots)
+        if not slots:
+            return []
+        functions = self.contract_instance.functions
+
+        async def read(call):
+            try:
+                return await call.call()
+            except Exception:
+                return None
+
+        submitted, statuses = await asyncio.gather(
+            asyncio.gather(*(read(functions.submittedPredval(s, predictoor)) for s in slots)),
+            asyncio.gather(*(read(functions.epochStatus(s)) for s in slots)),
+        )
+        seconds_per_epoch = await self.get_secondsPerEpoch()
+        timeout = await self.get_trueValSubmitTimeoutEpoch() * seconds_per_epoch
+        cur_epoch_ts = await self.get_current_epoch() * seconds_per_epoch
+        candidates = [
+            (slot, status)
+            for slot, is_submitted, status in zip(slots, submitted, statuses)
+            if is_submitted
+            and status is not None
+            and (status != EPOCH_STATUS_PENDING or cur_epoch_ts - slot >= timeout)
+        ]
+        auth = self.get_auth_signature()
+
+        async def true_value(slot, status):
+            if status != EPOCH_STATUS_PAYING:
+                return None
+            return await read(functions.trueValues(slot))
+
+        predictions, true_values = await asyncio.gather(
+            asyncio.gather(
+                *(read(functions.getPrediction(s, predictoor, auth)) for s, _ in candidates)
+            ),
+            asyncio.gather(*(true_value(s, status) for s, status in candidates)),
+        )
+        return [
+            slot
+            for (slot, status), prediction, value in zip(
+                candidates, predictions, true_values
+            )
+            if is_claimable(status, prediction, value)
+        ]
+
+    async def claim_payouts(
+        self, start_ts, end_ts, slots_per_tx=100, wait_for_receipt=True
+    ):
+        """See PredictorContract.claim_payouts."""
+        seconds_per_epoch = await self.get_secondsPerEpoch()
+        first_slot = -(-start_ts // seconds_per_epoch) * seconds_per_epoch
+        slots = range(first_slot, end_ts + 1, seconds_per_epoch)
+        claimable = await self.get_claimable_slots(slots)
+        if claimable and self.has_function("payoutMultiple"):
+            sends = [
+                self.payout_multiple(claimable[i : i + slots_per_tx])
+                for i in range(0, len(claimable), slots_per_tx)
+            ]
+        else:
+            sends = [self.payout(slot) for slot in claimable]
+        tx_hashes = await asyncio.gather(*sends)
+        summary = {
+            "checked": len(slots),
+            "claimable": claimable,
+            "tx_hashes": tx_hashes,
+            "failed": tx_hashes.count(None),
+        }
+        if wait_for_receipt:
+
+            async def wait(tx):
+                try:
+                    return tx and await self.config.wait_for_receipt(tx)
+                except Exception as e:
+                    logger.warning("Waiting for a receipt failed: %s", e)
+                    return None
+
+            receipts = await asyncio.gather(*(wait(tx) for tx in tx_hashes))
+            summary["receipts"] = receipts
+            summary["failed"] = sum(
+                1 for receipt in receipts if receipt is None or receipt["status"] != 1
+            )
+        return summary
+
+    async def soonest_timestamp_to_predict(self, timestamp):
+        return await self.contract_instance.functions.soonestEpochToPredict(
+            timestamp
+        ).call()
+
+    async def submit_prediction(
+        self,
+        predicted_value: bool,
+        stake_amount: int,
+        prediction_ts: int,
+        wait_for_receipt=True,
+    ):
+        """See PredictorContract.submit_prediction."""
+        amount_wei = self.config.w3.to_wei(str(stake_amount), "ether")
+        token = await self.get_token()
+        if not await token.ensure_allowance(
+            self.contract_address, amount_wei, self.approval_budget
+        ):
+            logger.error("Error while approving the contract to spend tokens")
+            return None
+
+        try:
+            if is_sapphire_network(await self.config.w3.eth.chain_id):
+                nonce = await self.config.nonce_manager.next_nonce()
+                # the Sapphire wrapper is blocking, keep it off the loop
+                try:
+                    res, txhash = await asyncio.get_running_loop().run_in_executor(
+                        None,
+                        functools.partial(
+                            send_encrypted_tx,
+                            self.contract_instance,
+                            "submitPredval",
+                            [predicted_value, amount_wei, prediction_ts],
+                            self.config.account.key.hex()[2:],
+                            self.config.owner,
+                            self.contract_address,
+                            self.config.rpc_url,
+                            gasLimit=1000000,
+                            nonce=nonce,
+                        ),
+                    )
+                    logger.info("Encrypted transaction status code: %s", res)
+                    check_encrypted_tx(res, txhash)
+                except Exception as e:
+                    self.config.nonce_manager.failed(nonce, e)
+                    raise
+                self.config.nonce_manager.sent(nonce)
+            else:
+                tx = await self.config.transact(
+                    self.contract_instance.functions.submitPredval(
+                        predicted_value, amount_wei, prediction_ts
+                    )
+                )
+                txhash = tx.hex()
+            token.spend_allowance(self.contract_address, amount_wei)
+
+            logger.info("Submitted prediction, txhash: %s", txhash)
+            if not wait_for_receipt:
+                return txhash
+            return await self.config.wait_for_receipt(txhash)
+        except Exception as e:
+            logger.error("submitPredval failed: %s", e)
+            return None
+
+    async def get_prediction(self, slot):
+        return await self.contract_instance.functions.getPrediction(slot).call(
+            {"from": self.config.owner}
+        )
+
+    async def submit_trueval(
+        self, true_val, timestamp, float_value, cancel_round, wait_for_receipt=True
+    ):
+        fl_value = self.config.w3.to_wei(str(float_value), "ether")
+        return await self._transact_and_wait(
+            self.contract_instance.functions.submitTrueVal(
+                timestamp, true_val, fl_value, cancel_round
+            ),
+            wait_for_receipt,
+        )
+
+    async def redeem_unused_slot_revenue(self, timestamp, wait_for_receipt=True):
+        return await self._transact_and_wait(
+            self.contract_instance.functions.redeemUnusedSlotRevenue(timestamp),
+            wait_for_receipt,
+        )
+
+    async def get_block(self, block):
+        return await self.config.w3.eth.get_block(block)
+
+
+class AsyncFixedRate:
+    def __init__(self, config: AsyncWeb3Config, address: str):
+        self.contract_address = config.w3.to_checksum_address(address)
+        self.contract_instance = config.get_contract_factory("FixedRateExchange")(
+            address=self.contract_address
+        )
+        self.config = config
+
+    async def get_dt_price(self, exchangeId):
+        return await self.contract_instance.functions.calcBaseInGivenOutDT(
+            exchangeId, self.config.w3.to_wei("1", "ether"), 0
+        ).call()
@@ -0,0 +1,125 @@
+import json
+import os
+
+from pdr_utils.subgraph import get_subgraph_block, scan_prediction_contracts
+
+
+class ContractRegistry:
+    """Keeps discovered prediction contracts in a JSON-lines snapshot so
+    that restarts only ask the subgraph for contracts created since the
+    last sync.
+
+    The first line of the snapshot is a header with the subgraph url, the
+    filters and the last synced block; every other line is one contract,
+    as returned by get_all_interesting_prediction_contracts. A snapshot
+    taken with different filters or for another subgraph is ignored.
+
+    A feed can be indexed before its nftData is set, and the block_gt delta
+    never returns it again; every delta sync therefore also re-fetches the
+    known contracts still missing one of REFRESH_KEYS.
+    """
+
+    VERSION = 1
+    REFRESH_KEYS = ("pair", "timeframe", "source")
+
+    def __init__(
+        self,
+        path,
+        subgraph_url,
+        pairs=None,
+        timeframes=None,
+        sources=None,
+        owners=None,
+        client=None,
+    ):
+        self.path = path
+        self.subgraph_url = subgraph_url
+        self.filters = {
+            "pairs": pairs,
+            "timeframes": timeframes,
+            "sources": sources,
+            "owners": owners,
+        }
+        self.client = client
+        self.block = None
+        self.contracts = {}
+        self.load()
+
+    def header(self):
+        return {
+            "version": self.VERSION,
+            "subgraph_url": self.subgraph_url,
+            "filters": self.filters,
+            "block": self.block,
+        }
+
+    def load(self):
+        """Loads the snapshot if it matches this registry; returns True if so."""
+        if not os.path.exists(self.path):
+            return False
+        with open(self.path) as f:
+            try:
+                header = json.loads(f.readline())
+                contracts = [json.loads(line) for line in f if line.strip()]
+            except json.JSONDecodeError:
+                return False
+        expected = self.header()
+        if any(header.get(k) != expected[k] for k in ("version", "subgraph_url", "filters")):
+            return False
+        self.block = header["block"]
+        self.contracts = {contract["address"]: contract for contract in contracts}
+        return True
+
+    def incomplete(self):
+        """Returns the addresses of the contracts missing one of REFRESH_KEYS."""
+        return [
+            address
+            for address, contract in self.contracts.items()
+            if any(contract.get(key) is None for key in self.REFRESH_KEYS)
+        ]
+
+    def save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(json.dumps(self.header()) + "\n")
+            for contract in self.contracts.values():
+                f.write(json.dumps(contract) + "\n")
+        os.replace(tmp_path, self.path)
+
+    def sync(self, full=False):
+        """Fetches contracts created since the last synced block and the
+        incomplete ones again (or all of them if `full` or there is no
+        snapshot), merges and saves them.
+
+        Returns the dict of all known contracts, keyed by address.
+        """
+        # read the cursor before scanning: anything indexed meanwhile is
+        # picked up again by the next delta and merged by address
+        block = get_subgraph_block(self.subgraph_url, self.client)
+        where = None
+        stale = []
+        if self.block is not None and not full:
+            if block <= self.block:
+                return self.contracts
+            where = {"block_gt": self.block}
+            stale = self.incomplete()
+        else:
+            self.contracts = {}
+        if stale:
+            refreshed = scan_prediction_contracts(
+                self.subgraph_url,
+                **self.filters,
+                where={"id_in": stale},
+                client=self.client,
+            )
+            # the ones not returned are now filtered out by their info
+            for address in stale:
+                self.contracts.pop(address, None)
+            self.contracts.update(refreshed)
+        new_contracts = scan_prediction_contracts(
+            self.subgraph_url, **self.filters, where=where, client=self.client
+        )
+        self.contracts.update(new_contracts)
+        self.block = block
+        self.save()
+        return self.contracts
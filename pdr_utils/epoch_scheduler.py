@@ -0,0 +1,173 @@
+import asyncio
+import heapq
+import inspect
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class EpochScheduler:
+    """Fires callbacks at fixed offsets before the epoch boundaries of many
+    feeds, computed locally instead of polling curEpoch.
+
+    Epoch boundaries are multiples of each feed's (cached) secondsPerEpoch
+    in chain time. Chain time is local time plus an offset learnt from
+    block timestamps: re-synced with one RPC every `resync_interval`
+    seconds, and from every new block head when following a websocket
+    endpoint in run_async().
+
+    Callbacks are called as callback(contract, epoch_start_ts) where
+    epoch_start_ts is the boundary they fire before; in run_async() they
+    may be coroutines.
+    """
+
+    def __init__(self, config, ws_url=None, resync_interval=600):
+        self.config = config
+        self.ws_url = ws_url
+        self.resync_interval = resync_interval
+        self.clock_offset = 0.0
+        # (block timestamp - local receive time) of recent blocks; blocks
+        # are never stamped after they arrive, so the max is the best guess
+        self._observations = deque(maxlen=32)
+        self._timers = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._last_sync = None
+
+    def add_feed(self, contract, callback, offsets=(0,), seconds_per_epoch=None):
+        """Calls `callback` `offsets` seconds before each epoch boundary of
+        `contract` (a PredictorContract)."""
+        if seconds_per_epoch is None:
+            seconds_per_epoch = contract.get_secondsPerEpoch()
+        now = self.chain_time()
+        with self._lock:
+            for offset in offsets:
+                timer = (contract, callback, seconds_per_epoch, offset)
+                self._push(timer, self._next_epoch(timer, now))
+
+    def chain_time(self):
+        return time.time() + self.clock_offset
+
+    def observe_block(self, timestamp, received_at=None):
+        """Updates the clock offset from a block's timestamp."""
+        received_at = time.time() if received_at is None else received_at
+        self._observations.append(timestamp - received_at)
+        self.clock_offset = max(self._observations)
+
+    def sync_clock(self):
+        block = self.config.w3.eth.get_block("latest")
+        self.observe_block(block["timestamp"])
+        self._last_sync = time.monotonic()
+
+    def stop(self):
+        self._stop.set()
+
+    @staticmethod
+    def _next_epoch(timer, now):
+        """Returns the first epoch boundary whose firing time is after now."""
+        _, _, seconds_per_epoch, offset = timer
+        return (int(now + offset) // seconds_per_epoch + 1) * seconds_per_epoch
+
+    def _push(self, timer, epoch_start_ts):
+        fire_at = epoch_start_ts - timer[3]
+        heapq.heappush(self._timers, (fire_at, next(self._seq), epoch_start_ts, timer))
+
+    def _pop_due(self):
+        """Returns (seconds to wait, None) or (0, (timer, epoch_start_ts))."""
+        with self._lock:
+            while self._timers:
+                fire_at, _, epoch_start_ts, timer = self._timers[0]
+                now = self.chain_time()
+                if fire_at > now:
+                    return fire_at - now, None
+                heapq.heappop(self._timers)
+                # if we fell behind, skip to the next epoch still ahead of us
+                self._push(
+                    timer, max(epoch_start_ts + timer[2], self._next_epoch(timer, now))
+                )
+                # more than an epoch late (e.g. the clock was just synced): skip
+                if now - fire_at < timer[2]:
+                    return 0, (timer, epoch_start_ts)
+            return 1.0, None
+
+    def _needs_resync(self):
+        return self.resync_interval and (
+            self._last_sync is None
+            or time.monotonic() - self._last_sync > self.resync_interval
+        )
+
+    def run(self):
+        """Runs the scheduler in this thread until stop() is called."""
+        self._stop.clear()
+        while not self._stop.is_set():
+            if self._needs_resync():
+                try:
+                    self.sync_clock()
+                except Exception as e:
+                    logger.warning("Epoch scheduler clock sync failed: %s", e)
+                    self._last_sync = time.monotonic()
+            wait, due = self._pop_due()
+            if due is None:
+                self._stop.wait(min(wait, 1.0))
+                continue
+            (contract, callback, _, _), epoch_start_ts = due
+            try:
+                callback(contract, epoch_start_ts)
+            except Exception as e:
+                logger.error("Epoch callback failed: %s", e)
+
+    async def run_async(self):
+        """asyncio version of run(); follows new block heads over ws_url if
+        set. Coroutine callbacks are scheduled as tasks."""
+        self._stop.clear()
+        follower = asyncio.ensure_future(self._follow_heads()) if self.ws_url else None
+        try:
+            while not self._stop.is_set():
+                if self._needs_resync():
+                    try:
+                        await asyncio.get_running_loop().run_in_executor(
+                            None, self.sync_clock
+                        )
+                    except Exception as e:
+                        logger.warning("Epoch scheduler clock sync failed: %s", e)
+                        self._last_sync = time.monotonic()
+                wait, due = self._pop_due()
+                if due is None:
+                    await asyncio.sleep(min(wait, 1.0))
+                    continue
+                (contract, callback, _, _), epoch_start_ts = due
+                try:
+                    result = callback(contract, epoch_start_ts)
+                    if inspect.isawaitable(result):
+                        asyncio.ensure_future(result)
+                except Exception as e:
+                    logger.error("Epoch callback failed: %s", e)
+        finally:
+            if follower is not None:
+                follower.cancel()
+
+    async def _follow_heads(self):
+        # pylint: disable=import-outside-toplevel
+        from web3 import AsyncWeb3, WebsocketProviderV2
+
+        while not self._stop.is_set():
+            try:
+                async with AsyncWeb3.persistent_websocket(
+                    WebsocketProviderV2(self.ws_url)
+                ) as w3:
+                    await w3.eth.subscribe("newHeads")
+                    async for response in w3.ws.process_subscriptions():
+                        timestamp = response["result"]["timestamp"]
+                        if isinstance(timestamp, str):
+                            timestamp = int(timestamp, 16)
+                        self.observe_block(timestamp)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Block head subscription failed: %s", e)
+                await asyncio.sleep(5)
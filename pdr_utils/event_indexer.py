@@ -0,0 +1,188 @@
+import sqlite3
+import threading
+
+from eth_utils import event_abi_to_log_topic
+
+from pdr_utils.contract import get_contract_abi
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS predictions (
+    feed TEXT, slot INTEGER, predictoor TEXT, stake TEXT, block INTEGER, tx TEXT,
+    PRIMARY KEY (feed, slot, predictoor)
+);
+CREATE TABLE IF NOT EXISTS truevals (
+    feed TEXT, slot INTEGER, true_value INTEGER, status INTEGER, block INTEGER, tx TEXT,
+    PRIMARY KEY (feed, slot)
+);
+CREATE TABLE IF NOT EXISTS payouts (
+    feed TEXT, slot INTEGER, predictoor TEXT, stake TEXT, payout TEXT,
+    predicted_value INTEGER, true_value INTEGER, status INTEGER, block INTEGER, tx TEXT,
+    PRIMARY KEY (feed, slot, predictoor)
+);
+CREATE TABLE IF NOT EXISTS cursors (
+    feed TEXT PRIMARY KEY, last_block INTEGER
+);
+"""
+
+
+class EventIndexer:
+    """Indexes PredictionSubmitted, TruevalSubmitted and PredictionPayout
+    logs of prediction feeds into SQLite, keyed by (feed, slot, predictoor).
+
+    Logs are read with eth_getLogs over chunks of blocks for all feeds at
+    once; when the provider rejects a range (too many results, range too
+    large, timeout) it is split in half and the chunk size adapts. Each
+    feed's last indexed block is stored, so indexing resumes where it
+    stopped.
+    """
+
+    EVENTS = ("PredictionSubmitted", "TruevalSubmitted", "PredictionPayout")
+
+    def __init__(
+        self,
+        config,
+        db_path=":memory:",
+        chunk_size=5000,
+        min_chunk_size=1,
+        max_chunk_size=100000,
+    ):
+        self.config = config
+        self.chunk_size = chunk_size
+        self.min_chunk_size = min_chunk_size
+        self.max_chunk_size = max_chunk_size
+        self.db = sqlite3.connect(db_path, check_same_thread=False)
+        self.db.executescript(SCHEMA)
+        self._lock = threading.Lock()
+        # topic0 -> event abi, from the cached ERC20Template3 abi
+        self.event_abis = {
+            "0x" + event_abi_to_log_topic(abi).hex(): abi
+            for abi in get_contract_abi("ERC20Template3")
+            if abi["type"] == "event" and abi["name"] in self.EVENTS
+        }
+        self.events = config.get_contract_factory("ERC20Template3").events
+
+    def last_indexed_block(self, feed):
+        row = self.db.execute(
+            "SELECT last_block FROM cursors WHERE feed = ?", (feed.lower(),)
+        ).fetchone()
+        return None if row is None else row[0]
+
+    def index(self, feeds, from_block=0, to_block=None):
+        """Indexes the logs of `feeds` (addresses) up to `to_block` (default
+        latest), starting after each feed's last indexed block, or at
+        `from_block` for new feeds. Returns the number of logs stored."""
+        if to_block is None:
+            to_block = self.config.w3.eth.block_number
+        # feeds resuming from the same block are fetched together
+        starts = {}
+        for feed in feeds:
+            last_block = self.last_indexed_block(feed)
+            start = from_block if last_block is None else last_block + 1
+            starts.setdefault(start, []).append(self.config.w3.to_checksum_address(feed))
+
+        n_logs = 0
+        for start, addresses in sorted(starts.items()):
+            block = start
+            while block <= to_block:
+                end = min(block + self.chunk_size - 1, to_block)
+                logs = self._get_logs(addresses, block, end)
+                with self._lock, self.db:
+                    for log in logs:
+                        self._store(log)
+                    self.db.executemany(
+                        "INSERT OR REPLACE INTO cursors VALUES (?, ?)",
+                        [(address.lower(), end) for address in addresses],
+                    )
+                n_logs += len(logs)
+                block = end + 1
+        return n_logs
+
+    def _get_logs(self, addresses, from_block, to_block):
+        try:
+            logs = self.config.w3.eth.get_logs(
+                {
+                    "address": addresses,
+                    "fromBlock": from_block,
+                    "toBlock": to_block,
+                    "topics": [list(self.event_abis)],
+                }
+            )
+        except Exception:
+            size = to_block - from_block + 1
+            if size <= self.min_chunk_size:
+                raise
+            self.chunk_size = max(self.min_chunk_size, size // 2)
+            middle = from_block + size // 2
+            return self._get_logs(addresses, from_block, middle - 1) + self._get_logs(
+                addresses, middle, to_block
+            )
+        if to_block - from_block + 1 >= self.chunk_size:
+            self.chunk_size = min(self.max_chunk_size, self.chunk_size * 2)
+        return logs
+
+    def _store(self, log):
+        name = self.event_abis[log["topics"][0].hex()]["name"]
+        event = getattr(self.events, name)().process_log(log)
+        args = event["args"]
+        feed = event["address"].lower()
+        block, tx = event["blockNumber"], event["transactionHash"].hex()
+        if name == "PredictionSubmitted":
+            self.db.execute(
+                "INSERT OR REPLACE INTO predictions VALUES (?, ?, ?, ?, ?, ?)",
+                (feed, args["slot"], args["predictoor"].lower(), str(args["stake"]), block, tx),
+            )
+        elif name == "TruevalSubmitted":
+            self.db.execute(
+                "INSERT OR REPLACE INTO truevals VALUES (?, ?, ?, ?, ?, ?)",
+                (feed, args["slot"], int(args["trueValue"]), args["status"], block, tx),
+            )
+        else:
+            self.db.execute(
+                "INSERT OR REPLACE INTO payouts VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    feed,
+                    args["slot"],
+                    args["predictoor"].lower(),
+                    str(args["stake"]),
+                    str(args["payout"]),
+                    int(args["predictedValue"]),
+                    int(args["trueValue"]),
+                    args["status"],
+                    block,
+                    tx,
+                ),
+            )
+
+    def predictions(self, predictoor, feed=None):
+        """Returns the indexed predictions of `predictoor`, optionally for one feed."""
+        query = "SELECT feed, slot, stake, block, tx FROM predictions WHERE predictoor = ?"
+        params = [predictoor.lower()]
+        if feed is not None:
+            query += " AND feed = ?"
+            params.append(feed.lower())
+        rows = self.db.execute(query + " ORDER BY feed, slot", params).fetchall()
+        return [
+            {"feed": f, "slot": slot, "stake": int(stake), "block": block, "tx": tx}
+            for f, slot, stake, block, tx in rows
+        ]
+
+    def unclaimed_payouts(self, predictoor, feed=None):
+        """Returns the slots `predictoor` predicted on whose trueval (or
+        cancellation) is in and that were not paid out yet."""
+        query = """
+            SELECT p.feed, p.slot, p.stake, t.status
+            FROM predictions p
+            JOIN truevals t ON t.feed = p.feed AND t.slot = p.slot
+            LEFT JOIN payouts o
+                ON o.feed = p.feed AND o.slot = p.slot AND o.predictoor = p.predictoor
+            WHERE p.predictoor = ? AND o.slot IS NULL
+        """
+        params = [predictoor.lower()]
+        if feed is not None:
+            query += " AND p.feed = ?"
+            params.append(feed.lower())
+        rows = self.db.execute(query + " ORDER BY p.feed, p.slot", params).fetchall()
+        return [
+            {"feed": f, "slot": slot, "stake": int(stake), "status": status}
+            for f, slot, stake, status in rows
+        ]
@@ -0,0 +1,144 @@
+import asyncio
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class BaseGasOracle:
+    """Settings and fee math shared by GasOracle and AsyncGasOracle.
+
+    Fees are fetched with one request (eth_feeHistory on chains whose blocks
+    carry baseFeePerGas, EIP-1559 style, otherwise eth_gasPrice) and reused
+    for max_age seconds, so a burst of transactions prices them all
+    consistently; only the first refresh also reads the latest block, to
+    detect the fee market.
+    """
+
+    def __init__(
+        self,
+        w3,
+        use_eip1559=None,
+        max_age=2.0,
+        fee_history_blocks=5,
+        priority_fee_percentile=50,
+        base_fee_multiplier=2,
+    ):
+        self.w3 = w3
+        self.use_eip1559 = use_eip1559  # None = detect from the latest block
+        self.max_age = max_age
+        self.fee_history_blocks = fee_history_blocks
+        self.priority_fee_percentile = priority_fee_percentile
+        self.base_fee_multiplier = base_fee_multiplier
+        self._fee_params = None
+        self._updated_at = 0.0
+
+    def _is_fresh(self):
+        return (
+            self._fee_params is not None
+            and time.monotonic() - self._updated_at < self.max_age
+        )
+
+    def _fees_from_history(self, fee_history):
+        rewards = sorted(reward[0] for reward in fee_history["reward"] if reward)
+        priority_fee = rewards[len(rewards) // 2] if rewards else 0
+        base_fee = fee_history["baseFeePerGas"][-1]  # next block's base fee
+        return {
+            "maxFeePerGas": base_fee * self.base_fee_multiplier + priority_fee,
+            "maxPriorityFeePerGas": priority_fee,
+        }
+
+
+class GasOracle(BaseGasOracle):
+    """Gas pricing shared by all transaction senders of a connection, see
+    BaseGasOracle. start() refreshes the cache in a background thread so
+    that senders never wait on it."""
+
+    def __init__(self, w3, **kwargs):
+        super().__init__(w3, **kwargs)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+
+    def get_fee_params(self):
+        """Returns {"gasPrice": ...} or {"maxFeePerGas": ...,
+        "maxPriorityFeePerGas": ...} to merge into transaction params."""
+        with self._lock:
+            if self._is_fresh():
+                return dict(self._fee_params)
+        return dict(self.refresh())
+
+    def refresh(self):
+        if self.use_eip1559 is None:
+            block = self.w3.eth.get_block("latest")
+            self.use_eip1559 = block.get("baseFeePerGas") is not None
+        if self.use_eip1559:
+            fee_params = self._fees_from_history(
+                self.w3.eth.fee_history(
+                    self.fee_history_blocks, "latest", [self.priority_fee_percentile]
+                )
+            )
+        else:
+            fee_params = {"gasPrice": self.w3.eth.gas_price}
+        with self._lock:
+            self._fee_params = fee_params
+            self._updated_at = time.monotonic()
+        return fee_params
+
+    def start(self, interval=None):
+        """Starts refreshing fees in a daemon thread every `interval` seconds
+        (default: max_age / 2)."""
+        if self._thread is not None:
+            return
+        interval = interval or self.max_age / 2
+        self._stop.clear()
+
+        def run():
+            while not self._stop.wait(interval):
+                try:
+                    self.refresh()
+                except Exception as e:
+                    logger.warning("Gas oracle refresh failed: %s", e)
+
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+class AsyncGasOracle(BaseGasOracle):
+    """Gas pricing for an AsyncWeb3 connection, see BaseGasOracle; fees are
+    refreshed on demand (at most once per max_age seconds)."""
+
+    def __init__(self, w3, **kwargs):
+        super().__init__(w3, **kwargs)
+        self._refresh_lock = None
+
+    async def get_fee_params(self):
+        if self._refresh_lock is None:
+            self._refresh_lock = asyncio.Lock()
+        # concurrent senders share one refresh
+        async with self._refresh_lock:
+            if not self._is_fresh():
+                await self.refresh()
+            return dict(self._fee_params)
+
+    async def refresh(self):
+        if self.use_eip1559 is None:
+            block = await self.w3.eth.get_block("latest")
+            self.use_eip1559 = block.get("baseFeePerGas") is not None
+        if self.use_eip1559:
+            self._fee_params = self._fees_from_history(
+                await self.w3.eth.fee_history(
+                    self.fee_history_blocks, "latest", [self.priority_fee_percentile]
+                )
+            )
+        else:
+            self._fee_params = {"gasPrice": await self.w3.eth.gas_price}
+        self._updated_at = time.monotonic()
+        return self._fee_params
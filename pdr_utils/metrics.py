@@ -0,0 +1,196 @@
+import os
+import re
+import threading
+import time
+from bisect import bisect_left
+from functools import lru_cache
+
+# upper bounds (seconds) of the latency histogram buckets, +Inf is implied
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# set to 1 to record metrics from startup, otherwise call metrics.enable()
+METRICS_ENV = "PDR_METRICS"
+
+
+class Metrics:
+    """Counts, errors, retries and latency histograms of subgraph queries
+    and RPC requests, per (kind, method, endpoint).
+
+    kind is "subgraph", "rpc" (requests as web3 makes them, eth_call and
+    transactions labelled with the contract function) or "rpc_endpoint"
+    (requests as an RPCPool sends them to each of its endpoints). While
+    disabled, instrumented calls only check the `enabled` flag.
+    """
+
+    def __init__(self, enabled=False, buckets=LATENCY_BUCKETS):
+        self.enabled = enabled
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+    def _get_series(self, kind, method, endpoint):
+        key = (kind, method, endpoint)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = {
+                "count": 0,
+                "errors": 0,
+                "retries": 0,
+                "latency_sum": 0.0,
+                "buckets": [0] * (len(self.buckets) + 1),
+            }
+        return series
+
+    def observe(self, kind, method, endpoint, latency, error=False):
+        """Records one call that took `latency` seconds."""
+        with self._lock:
+            series = self._get_series(kind, method, endpoint)
+            series["count"] += 1
+            series["errors"] += bool(error)
+            series["latency_sum"] += latency
+            series["buckets"][bisect_left(self.buckets, latency)] += 1
+
+    def retry(self, kind, method, endpoint):
+        """Records that a call is retried (or failed over)."""
+        with self._lock:
+            self._get_series(kind, method, endpoint)["retries"] += 1
+
+    def timer(self, kind, method, endpoint):
+        """Context manager observing the duration of its block; exceptions
+        count as errors. Use `if metrics.enabled` around it on hot paths."""
+        return _Timer(self, kind, method, endpoint)
+
+    def snapshot(self):
+        """Returns a list of dicts, one per (kind, method, endpoint), with
+        count, errors, retries, latency_sum, latency_avg and buckets, the
+        cumulative histogram as [(upper bound, count)] ending with inf."""
+        with self._lock:
+            items = [(key, dict(s, buckets=list(s["buckets"]))) for key, s in self._series.items()]
+        snapshot = []
+        for (kind, method, endpoint), series in sorted(items):
+            cumulative, buckets = 0, []
+            for bound, count in zip(self.buckets + (float("inf"),), series["buckets"]):
+                cumulative += count
+                buckets.append((bound, cumulative))
+            snapshot.append(
+                {
+                    "kind": kind,
+                    "method": method,
+                    "endpoint": endpoint,
+                    "count": series["count"],
+                    "errors": series["errors"],
+                    "retries": series["retries"],
+                    "latency_sum": series["latency_sum"],
+                    "latency_avg": series["latency_sum"] / series["count"]
+                    if series["count"]
+                    else None,
+                    "buckets": buckets,
+                }
+            )
+        return snapshot
+
+    def to_prometheus(self, prefix="pdr"):
+        """Returns the snapshot in the Prometheus text exposition format,
+        each metric family's samples grouped after its TYPE line."""
+        snapshot = [(_labels(series), series) for series in self.snapshot()]
+        lines = []
+        for name, key in (
+            ("requests_total", "count"),
+            ("request_errors_total", "errors"),
+            ("request_retries_total", "retries"),
+        ):
+            lines.append(f"# TYPE {prefix}_{name} counter")
+            for labels, series in snapshot:
+                lines.append(f"{prefix}_{name}{{{labels}}} {series[key]}")
+        name = f"{prefix}_request_latency_seconds"
+        lines.append(f"# TYPE {name} histogram")
+        for labels, series in snapshot:
+            for bound, count in series["buckets"]:
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'{name}_bucket{{{labels},le="{le}"}} {count}')
+            lines.append(f"{name}_sum{{{labels}}} {series['latency_sum']}")
+            lines.append(f"{name}_count{{{labels}}} {series['count']}")
+        return "\n".join(lines) + "\n"
+
+
+class _Timer:
+    def __init__(self, registry, kind, method, endpoint):
+        self.registry = registry
+        self.key = (kind, method, endpoint)
+        self.error = False
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.registry.observe(
+            *self.key, time.perf_counter() - self.start, self.error or exc_type is not None
+        )
+        return False
+
+
+def _labels(series):
+    return ",".join(
+        f'{name}="{_escape(series[name])}"' for name in ("kind", "method", "endpoint")
+    )
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+@lru_cache(maxsize=256)
+def query_name(query):
+    """Labels a GraphQL query by its first selected field, e.g. predictContracts."""
+    match = re.search(r"\{\s*(\w+)", query)
+    return match.group(1) if match else "query"
+
+
+def rpc_middleware(endpoint, method_label):
+    """Returns a web3 middleware recording every request as kind "rpc";
+    method_label(method, params) names it."""
+
+    def middleware(make_request, w3):  # pylint: disable=unused-argument
+        def middleware_fn(method, params):
+            if not metrics.enabled:
+                return make_request(method, params)
+            with metrics.timer("rpc", method_label(method, params), endpoint) as timer:
+                response = make_request(method, params)
+                timer.error = "error" in response
+            return response
+
+        return middleware_fn
+
+    return middleware
+
+
+def async_rpc_middleware(endpoint, method_label):
+    """AsyncWeb3 version of rpc_middleware."""
+
+    async def middleware(make_request, w3):  # pylint: disable=unused-argument
+        async def middleware_fn(method, params):
+            if not metrics.enabled:
+                return await make_request(method, params)
+            with metrics.timer("rpc", method_label(method, params), endpoint) as timer:
+                response = await make_request(method, params)
+                timer.error = "error" in response
+            return response
+
+        return middleware_fn
+
+    return middleware
+
+
+metrics = Metrics(enabled=os.getenv(METRICS_ENV, "").lower() in ("1", "true", "yes"))
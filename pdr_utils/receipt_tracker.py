@@ -0,0 +1,244 @@
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+import requests
+from web3 import HTTPProvider
+from web3._utils.method_formatters import receipt_formatter
+from web3.datastructures import AttributeDict
+from web3.exceptions import TransactionNotFound
+
+from pdr_utils.metrics import metrics
+from pdr_utils.rpc_pool import RPCPool
+
+logger = logging.getLogger(__name__)
+
+
+class ReceiptTracker:
+    """Follows the receipts of many transactions with one request per block.
+
+    Transaction hashes from any wrapper are handed to track(), which returns
+    a Future resolved with the receipt (and calls the optional callback).
+    A daemon thread watches the block number and, on each new block, asks
+    for the receipts of all pending transactions in one JSON-RPC batch;
+    providers without an HTTP endpoint, or endpoints rejecting batches, are
+    polled one eth_getTransactionReceipt at a time.
+
+    Transactions pending for more than `stuck_after` seconds are reported
+    once to on_stuck(tx_hash, seconds_pending), e.g. to replace them with a
+    higher fee; after `drop_after` seconds their future fails with
+    TimeoutError and they are no longer polled.
+    """
+
+    def __init__(
+        self,
+        config,
+        poll_interval=1.0,
+        stuck_after=120.0,
+        drop_after=3600.0,
+        on_stuck=None,
+        batch_size=500,
+        timeout=10,
+    ):
+        self.config = config
+        self.poll_interval = poll_interval
+        self.stuck_after = stuck_after
+        self.drop_after = drop_after
+        self.on_stuck = on_stuck
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.session = requests.Session()
+        self._pending = {}  # tx hash -> (future, callback, submitted at, reported stuck)
+        self._lock = threading.Lock()
+        self._block_number = None
+        self._batch_supported = True
+        self._thread = None
+        self._stop = threading.Event()
+
+    def track(self, tx_hash, callback=None):
+        """Follows `tx_hash`; returns a Future of its receipt. `callback`
+        is called with the receipt once it is mined."""
+        tx_hash = self._normalize(tx_hash)
+        with self._lock:
+            if tx_hash in self._pending:
+                return self._pending[tx_hash][0]
+            future = Future()
+            self._pending[tx_hash] = [future, callback, time.monotonic(), False]
+        return future
+
+    def wait(self, tx_hash, timeout=120):
+        """Blocks until the receipt of `tx_hash` is in; starts the polling
+        thread if it is not running. On timeout the transaction is no
+        longer followed."""
+        self.start()
+        try:
+            return self.track(tx_hash).result(timeout)
+        except FutureTimeoutError:
+            self.forget(tx_hash)
+            raise
+
+    def forget(self, tx_hash):
+        """Stops following `tx_hash`, e.g. after it was replaced."""
+        with self._lock:
+            entry = self._pending.pop(self._normalize(tx_hash), None)
+        if entry is not None:
+            entry[0].cancel()
+
+    def pending(self):
+        with self._lock:
+            return list(self._pending)
+
+    def stuck(self):
+        """Returns {tx_hash: seconds pending} of the stuck transactions."""
+        now = time.monotonic()
+        with self._lock:
+            return {
+                tx_hash: now - entry[2]
+                for tx_hash, entry in self._pending.items()
+                if now - entry[2] > self.stuck_after
+            }
+
+    def poll(self, force=False):
+        """Fetches the receipts of all pending transactions if a new block
+        was mined since the last poll (or if force); returns how many
+        transactions got resolved."""
+        tx_hashes = self.pending()
+        if not tx_hashes:
+            return 0
+        block_number = self.config.w3.eth.block_number
+        if not force and block_number == self._block_number:
+            return 0
+        self._block_number = block_number
+
+        receipts = {}
+        for i in range(0, len(tx_hashes), self.batch_size):
+            receipts.update(self._get_receipts(tx_hashes[i : i + self.batch_size]))
+
+        resolved = []
+        now = time.monotonic()
+        with self._lock:
+            for tx_hash in tx_hashes:
+                entry = self._pending.get(tx_hash)
+                if entry is None:
+                    continue
+                if receipts.get(tx_hash) is not None:
+                    resolved.append((self._pending.pop(tx_hash), receipts[tx_hash]))
+                elif now - entry[2] > self.drop_after:
+                    self._pending.pop(tx_hash)
+                    entry[0].set_exception(
+                        TimeoutError(f"Transaction {tx_hash} not mined")
+                    )
+                elif now - entry[2] > self.stuck_after and not entry[3]:
+                    entry[3] = True
+                    if self.on_stuck is not None:
+                        resolved.append((None, (tx_hash, now - entry[2])))
+
+        # callbacks run outside the lock, they may track more transactions
+        for entry, receipt in resolved:
+            if entry is None:
+                self._call(self.on_stuck, *receipt)
+                continue
+            future, callback = entry[0], entry[1]
+            if not future.cancelled():
+                future.set_result(receipt)
+            if callback is not None:
+                self._call(callback, receipt)
+        return sum(1 for entry, _ in resolved if entry is not None)
+
+    def _get_receipts(self, tx_hashes):
+        """Returns {tx_hash: receipt or None}."""
+        url = self._endpoint_url()
+        if url is not None and self._batch_supported:
+            payload = [
+                {
+                    "jsonrpc": "2.0",
+                    "id": n,
+                    "method": "eth_getTransactionReceipt",
+                    "params": [tx_hash],
+                }
+                for n, tx_hash in enumerate(tx_hashes)
+            ]
+            try:
+                results = self._post_batch(url, payload)
+                if isinstance(results, list):
+                    receipts = {}
+                    for result in results:
+                        raw = result.get("result")
+                        receipts[tx_hashes[result["id"]]] = (
+                            AttributeDict.recursive(receipt_formatter(raw))
+                            if raw
+                            else None
+                        )
+                    return receipts
+                # a single error object: the endpoint does not do batches
+                self._batch_supported = False
+            except Exception as e:
+                logger.warning("Batched receipt request failed: %s", e)
+        receipts = {}
+        for tx_hash in tx_hashes:
+            try:
+                receipts[tx_hash] = self.config.w3.eth.get_transaction_receipt(tx_hash)
+            except TransactionNotFound:
+                receipts[tx_hash] = None
+            except Exception as e:
+                logger.warning("Reading receipt %s failed: %s", tx_hash, e)
+                receipts[tx_hash] = None
+        return receipts
+
+    def _post_batch(self, url, payload):
+        if not metrics.enabled:
+            return self._post(url, payload)
+        method = "eth_getTransactionReceipt:batch"
+        with metrics.timer("rpc", method, url):
+            return self._post(url, payload)
+
+    def _post(self, url, payload):
+        response = self.session.post(url, json=payload, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def _endpoint_url(self):
+        provider = self.config.w3.provider
+        if isinstance(provider, RPCPool):
+            return provider.write_endpoint.url
+        if isinstance(provider, HTTPProvider):
+            return provider.endpoint_uri
+        return None
+
+    @staticmethod
+    def _normalize(tx_hash):
+        if isinstance(tx_hash, (bytes, bytearray)):
+            tx_hash = tx_hash.hex()
+        tx_hash = tx_hash.lower()
+        return tx_hash if tx_hash.startswith("0x") else "0x" + tx_hash
+
+    @staticmethod
+    def _call(fn, *args):
+        try:
+            fn(*args)
+        except Exception as e:
+            logger.error("Receipt callback failed: %s", e)
+
+    def start(self):
+        """Starts polling in a daemon thread every poll_interval seconds."""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.poll()
+            except Exception as e:
+                logger.warning("Receipt polling failed: %s", e)
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
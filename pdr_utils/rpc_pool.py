@@ -0,0 +1,250 @@
+import itertools
+import logging
+import threading
+import time
+
+from requests.exceptions import ConnectionError as RequestsConnectionError
+from web3 import HTTPProvider
+from web3.providers.base import BaseProvider
+
+from pdr_utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# requests that depend on the account's pending state: they all go to the
+# same endpoint, so nonces and just-sent transactions are seen consistently
+STICKY_METHODS = {
+    "eth_sendRawTransaction",
+    "eth_sendTransaction",
+    "eth_getTransactionCount",
+    "eth_estimateGas",
+    "eth_getTransactionByHash",
+    "eth_getTransactionReceipt",
+}
+
+# a send that failed after connecting may have been delivered: it is only
+# retried elsewhere if the connection itself failed, a rebroadcast would be
+# rejected as "already known" or "nonce too low"
+SEND_METHODS = {"eth_sendRawTransaction", "eth_sendTransaction"}
+
+# JSON-RPC error codes of rate limited / overloaded endpoints, retried elsewhere
+RETRY_ERROR_CODES = {429, -32005}
+
+
+class Endpoint:
+    """One RPC URL of a pool and its health and latency record."""
+
+    def __init__(self, url, request_kwargs=None, latency_alpha=0.2):
+        self.url = url
+        self.provider = HTTPProvider(url, request_kwargs=request_kwargs)
+        self.latency_alpha = latency_alpha
+        self.latency = None  # moving average, seconds
+        self.block_number = None
+        self.in_flight = 0
+        self.requests = 0
+        self.errors = 0
+        self.failures = 0  # consecutive
+        self.down_until = 0.0
+
+    def is_healthy(self, now=None):
+        return (now or time.monotonic()) >= self.down_until
+
+    def record_success(self, latency):
+        self.requests += 1
+        self.failures = 0
+        if self.latency is None:
+            self.latency = latency
+        else:
+            self.latency += self.latency_alpha * (latency - self.latency)
+
+    def record_failure(self, cooldown, max_cooldown):
+        self.requests += 1
+        self.errors += 1
+        self.failures += 1
+        # exponential cooldown for endpoints that keep failing
+        backoff = min(max_cooldown, cooldown * 2 ** (self.failures - 1))
+        self.down_until = time.monotonic() + backoff
+
+    def stats(self):
+        return {
+            "url": self.url,
+            "healthy": self.is_healthy(),
+            "latency": self.latency,
+            "block_number": self.block_number,
+            "requests": self.requests,
+            "errors": self.errors,
+        }
+
+
+class RPCPool(BaseProvider):
+    """web3 provider spreading requests over several RPC endpoints.
+
+    Reads go to the endpoint picked by `strategy`: "least_latency" (lowest
+    moving-average latency, weighted by requests in flight, so concurrent
+    reads spread out) or "round_robin". Requests in STICKY_METHODS go to
+    one write endpoint, which only changes when it fails. A request that
+    fails at the transport level or is rate limited is retried on the next
+    endpoint (transactions only if the connection failed, see
+    SEND_METHODS), and the failing one is skipped for a cooldown that
+    doubles with each consecutive failure. start_health_checks() probes all
+    endpoints in a daemon thread and also marks endpoints lagging more than
+    max_block_lag blocks behind the others as down.
+    """
+
+    STRATEGIES = ("least_latency", "round_robin")
+
+    def __init__(
+        self,
+        urls,
+        strategy="least_latency",
+        request_kwargs=None,
+        cooldown=5.0,
+        max_cooldown=300.0,
+        max_block_lag=5,
+    ):
+        super().__init__()
+        if not urls:
+            raise ValueError("RPCPool needs at least one RPC URL")
+        if strategy not in self.STRATEGIES:
+            raise ValueError(f"Unknown RPC selection strategy: {strategy}")
+        if request_kwargs is None:
+            request_kwargs = {"timeout": 10}
+        self.endpoints = [Endpoint(url, request_kwargs) for url in urls]
+        self.strategy = strategy
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.max_block_lag = max_block_lag
+        self._lock = threading.Lock()
+        self._round_robin = itertools.count()
+        self._write_endpoint = self.endpoints[0]
+        self._thread = None
+        self._stop = threading.Event()
+
+    @property
+    def write_endpoint(self):
+        return self._write_endpoint
+
+    def make_request(self, method, params):
+        sticky = method in STICKY_METHODS
+        last_error = None
+        for n, endpoint in enumerate(self._candidates(sticky)):
+            if n and metrics.enabled:
+                metrics.retry("rpc_endpoint", method, endpoint.url)
+            try:
+                response = self._send(endpoint, method, params)
+            except Exception as e:
+                if method in SEND_METHODS and not isinstance(e, RequestsConnectionError):
+                    raise
+                last_error = e
+                continue
+            error = response.get("error")
+            if isinstance(error, dict) and error.get("code") in RETRY_ERROR_CODES:
+                with self._lock:
+                    endpoint.record_failure(self.cooldown, self.max_cooldown)
+                last_error = response
+                continue
+            if sticky and endpoint is not self._write_endpoint:
+                self._write_endpoint = endpoint
+            return response
+        if isinstance(last_error, Exception):
+            raise last_error
+        return last_error
+
+    def _send(self, endpoint, method, params):
+        with self._lock:
+            endpoint.in_flight += 1
+        start = time.monotonic()
+        try:
+            response = endpoint.provider.make_request(method, params)
+        except Exception:
+            latency = time.monotonic() - start
+            with self._lock:
+                endpoint.in_flight -= 1
+                endpoint.record_failure(self.cooldown, self.max_cooldown)
+            if metrics.enabled:
+                metrics.observe("rpc_endpoint", method, endpoint.url, latency, True)
+            raise
+        latency = time.monotonic() - start
+        with self._lock:
+            endpoint.in_flight -= 1
+            endpoint.record_success(latency)
+        if metrics.enabled:
+            metrics.observe(
+                "rpc_endpoint", method, endpoint.url, latency, "error" in response
+            )
+        return response
+
+    def _candidates(self, sticky):
+        """Endpoints to try in order: the preferred one first, then the
+        other healthy ones, then those cooling down (soonest back first)."""
+        now = time.monotonic()
+        with self._lock:
+            healthy = [e for e in self.endpoints if e.is_healthy(now)]
+            down = sorted(
+                (e for e in self.endpoints if not e.is_healthy(now)),
+                key=lambda e: e.down_until,
+            )
+            if sticky:
+                first = self._write_endpoint
+                if first not in healthy:
+                    first = healthy[0] if healthy else down[0]
+            elif not healthy:
+                first = down[0]
+            elif self.strategy == "round_robin":
+                first = healthy[next(self._round_robin) % len(healthy)]
+            else:
+                # endpoints without a measurement yet are tried first
+                first = min(
+                    healthy, key=lambda e: (e.latency or 0.0) * (e.in_flight + 1)
+                )
+        return [first] + [e for e in healthy + down if e is not first]
+
+    def check_health(self):
+        """Probes every endpoint with eth_blockNumber; endpoints that answer
+        are back in rotation unless they lag behind."""
+        for endpoint in self.endpoints:
+            try:
+                response = self._send(endpoint, "eth_blockNumber", [])
+                endpoint.block_number = int(response["result"], 16)
+                endpoint.down_until = 0.0
+            except Exception:
+                endpoint.block_number = None
+        heights = [e.block_number for e in self.endpoints if e.block_number is not None]
+        if not heights:
+            return
+        with self._lock:
+            for endpoint in self.endpoints:
+                lag = max(heights) - (endpoint.block_number or 0)
+                if endpoint.block_number is not None and lag > self.max_block_lag:
+                    endpoint.record_failure(self.cooldown, self.max_cooldown)
+
+    def start_health_checks(self, interval=15.0):
+        """Runs check_health() every `interval` seconds in a daemon thread."""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+
+        def run():
+            while not self._stop.wait(interval):
+                try:
+                    self.check_health()
+                except Exception as e:
+                    logger.warning("RPC health check failed: %s", e)
+
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def is_connected(self, show_traceback=False):
+        return any(
+            e.provider.is_connected(show_traceback=show_traceback)
+            for e in self.endpoints
+        )
+
+    def stats(self):
+        return [endpoint.stats() for endpoint in self.endpoints]
@@ -1,124 +1,450 @@
+import logging
 import os
+import random
+import threading
+import time
+from functools import lru_cache
+
 import requests
+from requests.adapters import HTTPAdapter
 from web3 import Web3
 
+from pdr_utils.metrics import metrics, query_name
+
+logger = logging.getLogger(__name__)
+
+# nftData keys are stored on-chain as keccak(field name); hash them once
+# so that decoding an nftData entry costs a single dict lookup
+INFO_KEYS = ("pair", "base", "quote", "source", "timeframe")
+INFO_KEY_BY_HASH = {
+    Web3.keccak(info_key.encode("utf-8")).hex(): info_key for info_key in INFO_KEYS
+}
+
+
+@lru_cache(maxsize=4096)
+def decode_nft_value(hex_value):
+    """Returns the text stored in an nftData value, memoized by hex value."""
+    return Web3.to_text(hexstr=hex_value)
+
+
+def decode_nft_data(nft_data):
+    """Returns the pair/base/quote/source/timeframe info of an nftData list."""
+    info = dict.fromkeys(INFO_KEYS)
+    for item in nft_data:
+        info_key = INFO_KEY_BY_HASH.get(item["key"])
+        if info_key is not None:
+            info[info_key] = decode_nft_value(item["value"])
+    return info
+
+
+class BaseSubgraphClient:
+    """Settings and retry policy shared by SubgraphClient and
+    AsyncSubgraphClient: transient failures (connection errors, timeouts
+    and RETRY_STATUS_CODES) are retried up to max_retries times with
+    jittered exponential backoff."""
+
+    RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
 
-def query_subgraph(subgraph_url, query):
-    request = requests.post(subgraph_url, "", json={"query": query}, timeout=1.5)
-    if request.status_code != 200:
+    def __init__(
+        self,
+        subgraph_url,
+        timeout=1.5,
+        max_retries=3,
+        backoff_factor=0.25,
+        max_backoff=8.0,
+    ):
+        self.subgraph_url = subgraph_url
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+
+    def backoff(self, attempt):
+        """Returns the delay before retry number `attempt` (full jitter)."""
+        return random.uniform(
+            0, min(self.max_backoff, self.backoff_factor * (2**attempt))
+        )
+
+    @staticmethod
+    def _payload(query, variables):
+        payload = {"query": query}
+        if variables is not None:
+            payload["variables"] = variables
+        return payload
+
+    def _status_error(self, status, query):
+        """Returns the error for a non-200 response, raising it right away
+        if the status is not worth a retry."""
         # pylint: disable=broad-exception-raised
-        raise Exception(
-            f"Query failed. Url: {subgraph_url}. Return code is {request.status_code}\n{query}"
+        error = Exception(
+            f"Query failed. Url: {self.subgraph_url}. Return code is {status}\n{query}"
         )
-    result = request.json()
-    return result
+        if status not in self.RETRY_STATUS_CODES:
+            raise error
+        return error
 
+    def _retry_delay(self, error, attempt, query):
+        """Raises `error` once the retries are used up, otherwise returns
+        the delay before the next attempt."""
+        if attempt >= self.max_retries:
+            raise error
+        if metrics.enabled:
+            metrics.retry("subgraph", query_name(query), self.subgraph_url)
+        return self.backoff(attempt)
 
-def get_all_interesting_prediction_contracts(
-    subgraph_url, pairs=None, timeframes=None, sources=None, owners=None
-):
-    chunk_size = 1000  # max for subgraph = 1000
-    offset = 0
-    contracts = {}
-    # prepare keys
-    owners_filter = []
-    pairs_filter = []
-    timeframes_filter = []
-    sources_filter = []
-    if owners:
-        owners_filter = [owner.lower() for owner in owners.split(",")]
-    if pairs:
-        pairs_filter = [pair for pair in pairs.split(",") if pairs]
-    if timeframes:
-        timeframes_filter = [
-            timeframe for timeframe in timeframes.split(",") if timeframes
-        ]
-    if sources:
-        sources_filter = [source for source in sources.split(",") if sources]
 
-    while True:
-        query = """
-        {
-            predictContracts(skip:%s, first:%s){
-                id
-                token {
+class SubgraphClient(BaseSubgraphClient):
+    """Queries a subgraph over a pooled keep-alive session, retrying
+    transient failures as described in BaseSubgraphClient."""
+
+    def __init__(self, subgraph_url, pool_size=10, **kwargs):
+        super().__init__(subgraph_url, **kwargs)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def query(self, query, variables=None):
+        if not metrics.enabled:
+            return self._query(query, variables)
+        with metrics.timer("subgraph", query_name(query), self.subgraph_url) as timer:
+            result = self._query(query, variables)
+            timer.error = "errors" in result
+        return result
+
+    def _query(self, query, variables):
+        payload = self._payload(query, variables)
+        attempt = 0
+        while True:
+            try:
+                request = self.session.post(
+                    self.subgraph_url, json=payload, timeout=self.timeout
+                )
+                if request.status_code == 200:
+                    return request.json()
+                error = self._status_error(request.status_code, query)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+            time.sleep(self._retry_delay(error, attempt, query))
+            attempt += 1
+
+    def close(self):
+        self.session.close()
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_subgraph_client(subgraph_url):
+    """Returns the shared SubgraphClient for a subgraph url."""
+    with _clients_lock:
+        client = _clients.get(subgraph_url)
+        if client is None:
+            client = _clients[subgraph_url] = SubgraphClient(subgraph_url)
+        return client
+
+
+def query_subgraph(subgraph_url, query, variables=None, client=None):
+    if client is None:
+        client = get_subgraph_client(subgraph_url)
+    return client.query(query, variables)
+
+
+# only fetch the nftData entries we decode, instead of all of them
+INFO_KEYS_FILTER = ", ".join(f'"{key_hash}"' for key_hash in INFO_KEY_BY_HASH)
+
+PREDICT_CONTRACTS_QUERY = """
+query PredictContracts($first: Int!, $where: PredictContract_filter!) {
+    predictContracts(
+        first: $first, where: $where, orderBy: id, orderDirection: asc
+    ){
+        id
+        token {
+            id
+            name
+            symbol
+            nft {
+                owner {
                     id
-                    name
-                    symbol
-                    nft {
-                        owner {
-                            id
-                        }
-                        nftData {
-                            key
-                            value
-                        }
-                    }
                 }
-                blocksPerEpoch
-                blocksPerSubscription
-                truevalSubmitTimeoutBlock
+                nftData(where: {key_in: [%s]}) {
+                    key
+                    value
+                }
             }
         }
-        """ % (
-            offset,
-            chunk_size,
+        blocksPerEpoch
+        blocksPerSubscription
+        truevalSubmitTimeoutBlock
+    }
+}
+""" % (
+    INFO_KEYS_FILTER,
+)
+
+NFTS_QUERY = """
+query Nfts($first: Int!, $where: Nft_filter!) {
+    nfts(first: $first, where: $where, orderBy: id, orderDirection: asc){
+        id
+    }
+}
+"""
+
+# graph-node can't nest child filters (token_: {nft_: {owner_in}}), so the
+# owner filter is resolved to nft ids first and sent in batches of nft_in
+NFT_IDS_PER_QUERY = 500
+
+
+def paginate_subgraph(subgraph_url, query, entity, where=None, client=None):
+    """Yields pages of `entity` rows matching `where`, walking the id cursor.
+
+    Keyset pagination keeps every page equally cheap no matter how deep we
+    are, unlike skip/first.
+    """
+    chunk_size = 1000  # max for subgraph = 1000
+    where = dict(where or {})
+    last_id = ""
+    while True:
+        result = query_subgraph(
+            subgraph_url,
+            query,
+            {"first": chunk_size, "where": {**where, "id_gt": last_id}},
+            client=client,
+        )
+        page = result["data"][entity]
+        del result
+        done = len(page) < chunk_size
+        if page:
+            last_id = page[-1]["id"]
+            yield page
+        # drop the page before fetching the next one, so that at most one
+        # page is alive at a time
+        del page
+        if done:
+            return
+
+
+META_BLOCK_QUERY = """
+{
+    _meta {
+        block {
+            number
+        }
+    }
+}
+"""
+
+
+def get_subgraph_block(subgraph_url, client=None):
+    """Returns the latest block number indexed by the subgraph."""
+    result = query_subgraph(subgraph_url, META_BLOCK_QUERY, client=client)
+    return result["data"]["_meta"]["block"]["number"]
+
+
+def get_all_interesting_prediction_contracts(
+    subgraph_url, pairs=None, timeframes=None, sources=None, owners=None, client=None
+):
+    try:
+        return scan_prediction_contracts(
+            subgraph_url, pairs, timeframes, sources, owners, client=client
+        )
+    except Exception as e:
+        logger.error("Scanning prediction contracts failed: %s", e)
+        return {}
+
+
+def scan_prediction_contracts(
+    subgraph_url,
+    pairs=None,
+    timeframes=None,
+    sources=None,
+    owners=None,
+    where=None,
+    client=None,
+):
+    """Like get_all_interesting_prediction_contracts, but raises on errors
+    and accepts an extra PredictContract_filter, e.g. {"block_gt": n}."""
+    return {
+        feed.address: feed.as_dict()
+        for feed in iter_prediction_feeds(
+            subgraph_url, pairs, timeframes, sources, owners, where, client
+        )
+    }
+
+
+def iter_prediction_feeds(
+    subgraph_url,
+    pairs=None,
+    timeframes=None,
+    sources=None,
+    owners=None,
+    where=None,
+    client=None,
+):
+    """Yields the PredictionFeed of each matching contract, page by page:
+    only one page of the subgraph response is alive at a time. Raises on
+    errors, like scan_prediction_contracts."""
+    contract_filter = ContractFilter(pairs, timeframes, sources, owners)
+    for contracts_where in contract_filter.wheres(subgraph_url, where, client):
+        for page in paginate_subgraph(
+            subgraph_url,
+            PREDICT_CONTRACTS_QUERY,
+            "predictContracts",
+            contracts_where,
+            client,
+        ):
+            feeds = [contract_filter.decode_feed(contract) for contract in page]
+            for feed in feeds:
+                if feed is not None:
+                    yield feed
+
+
+class PredictionFeed:
+    """A discovered prediction contract; the compact form of the dicts
+    returned by get_all_interesting_prediction_contracts (see as_dict)."""
+
+    __slots__ = (
+        "name",
+        "address",
+        "symbol",
+        "blocks_per_epoch",
+        "blocks_per_subscription",
+        "last_submited_epoch",
+    ) + INFO_KEYS
+
+    def __init__(
+        self,
+        name,
+        address,
+        symbol,
+        blocks_per_epoch,
+        blocks_per_subscription,
+        last_submited_epoch=0,
+        pair=None,
+        base=None,
+        quote=None,
+        source=None,
+        timeframe=None,
+    ):  # pylint: disable=too-many-arguments
+        self.name = name
+        self.address = address
+        self.symbol = symbol
+        self.blocks_per_epoch = blocks_per_epoch
+        self.blocks_per_subscription = blocks_per_subscription
+        self.last_submited_epoch = last_submited_epoch
+        self.pair = pair
+        self.base = base
+        self.quote = quote
+        self.source = source
+        self.timeframe = timeframe
+
+    @classmethod
+    def from_dict(cls, info):
+        return cls(**{key: info.get(key) for key in cls.__slots__})
+
+    def as_dict(self):
+        return {key: getattr(self, key) for key in self.__slots__}
+
+    def __eq__(self, other):
+        if not isinstance(other, PredictionFeed):
+            return NotImplemented
+        return self.as_dict() == other.as_dict()
+
+    def __repr__(self):
+        return f"PredictionFeed({self.pair} {self.timeframe} {self.source}, {self.address})"
+
+
+class ContractFilter:
+    """The owners/pairs/timeframes/sources filters of a contract scan."""
+
+    def __init__(self, pairs=None, timeframes=None, sources=None, owners=None):
+        # prepare keys
+        self.owners_filter = []
+        self.pairs_filter = []
+        self.timeframes_filter = []
+        self.sources_filter = []
+        if owners:
+            self.owners_filter = [owner.lower() for owner in owners.split(",")]
+        if pairs:
+            self.pairs_filter = [pair for pair in pairs.split(",") if pairs]
+        if timeframes:
+            self.timeframes_filter = [
+                timeframe for timeframe in timeframes.split(",") if timeframes
+            ]
+        if sources:
+            self.sources_filter = [source for source in sources.split(",") if sources]
+
+    def wheres(self, subgraph_url, where=None, client=None):
+        """Returns the PredictContract_filter(s) to scan.
+
+        Owners are filtered server-side; pairs, timeframes and sources also
+        let through feeds without that key, so they stay in Python.
+        """
+        if not self.owners_filter:
+            return [dict(where or {})]
+        nft_ids = [
+            nft["id"]
+            for page in paginate_subgraph(
+                subgraph_url,
+                NFTS_QUERY,
+                "nfts",
+                {"owner_in": self.owners_filter},
+                client,
+            )
+            for nft in page
+        ]
+        return self.wheres_for_nfts(nft_ids, where)
+
+    @staticmethod
+    def wheres_for_nfts(nft_ids, where=None):
+        """Returns PredictContract_filters selecting the given nfts' feeds."""
+        return [
+            {**(where or {}), "token_": {"nft_in": nft_ids[i : i + NFT_IDS_PER_QUERY]}}
+            for i in range(0, len(nft_ids), NFT_IDS_PER_QUERY)
+        ]
+
+    def decode(self, contract):
+        """Returns the info dict of a predictContracts row, or None if it is
+        filtered out."""
+        feed = self.decode_feed(contract)
+        return None if feed is None else feed.as_dict()
+
+    def decode_feed(self, contract):
+        """Returns the PredictionFeed of a predictContracts row, or None if
+        it is filtered out."""
+        # nftData only holds the INFO_KEYS entries, see PREDICT_CONTRACTS_QUERY
+        info = decode_nft_data(contract["token"]["nft"]["nftData"])
+        # now do filtering
+        if (
+            (
+                len(self.owners_filter) > 0
+                and contract["token"]["nft"]["owner"]["id"] not in self.owners_filter
+            )
+            or (
+                len(self.pairs_filter) > 0
+                and info["pair"]
+                and info["pair"] not in self.pairs_filter
+            )
+            or (
+                len(self.timeframes_filter) > 0
+                and info["timeframe"]
+                and info["timeframe"] not in self.timeframes_filter
+            )
+            or (
+                len(self.sources_filter) > 0
+                and info["source"]
+                and info["source"] not in self.sources_filter
+            )
+        ):
+            return None
+
+        return PredictionFeed(
+            contract["token"]["name"],
+            contract["id"],
+            contract["token"]["symbol"],
+            contract["blocksPerEpoch"],
+            contract["blocksPerSubscription"],
+            0,
+            **info,
         )
-        offset += chunk_size
-        try:
-            result = query_subgraph(subgraph_url, query)
-            if result["data"]["predictContracts"] == []:
-                break
-            for contract in result["data"]["predictContracts"]:
-                # loop 725 values and get what we need
-                info = {
-                    "pair": None,
-                    "base": None,
-                    "quote": None,
-                    "source": None,
-                    "timeframe": None,
-                }
-                for nftData in contract["token"]["nft"]["nftData"]:
-                    for info_key, info_values in info.items():
-                        if (
-                            nftData["key"]
-                            == Web3.keccak(info_key.encode("utf-8")).hex()
-                        ):
-                            info[info_key] = Web3.to_text(hexstr=nftData["value"])
-                # now do filtering
-                if (
-                    (
-                        len(owners_filter) > 0
-                        and contract["token"]["nft"]["owner"]["id"] not in owners_filter
-                    )
-                    or (
-                        len(pairs_filter) > 0
-                        and info["pair"]
-                        and info["pair"] not in pairs_filter
-                    )
-                    or (
-                        len(timeframes_filter) > 0
-                        and info["timeframe"]
-                        and info["timeframe"] not in timeframes_filter
-                    )
-                    or (
-                        len(sources_filter) > 0
-                        and info["source"]
-                        and info["source"] not in sources_filter
-                    )
-                ):
-                    continue
-
-                contracts[contract["id"]] = {
-                    "name": contract["token"]["name"],
-                    "address": contract["id"],
-                    "symbol": contract["token"]["symbol"],
-                    "blocks_per_epoch": contract["blocksPerEpoch"],
-                    "blocks_per_subscription": contract["blocksPerSubscription"],
-                    "last_submited_epoch": 0,
-                }
-                contracts[contract["id"]].update(info)
-        except Exception as e:
-            print(e)
-            return {}
-    return contracts
@@ -0,0 +1,146 @@
+import asyncio
+
+import aiohttp
+
+from pdr_utils.metrics import metrics, query_name
+from pdr_utils.subgraph import (
+    NFTS_QUERY,
+    PREDICT_CONTRACTS_QUERY,
+    BaseSubgraphClient,
+    ContractFilter,
+)
+
+# predictContracts ids are addresses, so the id space splits evenly on the
+# first hex digit; each range is walked with its own id cursor
+ID_RANGES = [
+    ("0x%x" % i, "0x%x" % (i + 1) if i < 15 else None) for i in range(16)
+]
+
+
+class AsyncSubgraphClient(BaseSubgraphClient):
+    """asyncio counterpart of SubgraphClient: a pooled aiohttp session,
+    at most `max_concurrency` queries in flight, and the retries of
+    BaseSubgraphClient.
+
+    The session and the semaphore are created on the first query, inside
+    the event loop that runs it (on Python < 3.10 asyncio primitives bind
+    to the loop current at creation)."""
+
+    def __init__(self, subgraph_url, max_concurrency=8, **kwargs):
+        super().__init__(subgraph_url, **kwargs)
+        self.max_concurrency = max_concurrency
+        self.semaphore = None
+        self.session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def query(self, query, variables=None):
+        if not metrics.enabled:
+            return await self._query(query, variables)
+        with metrics.timer("subgraph", query_name(query), self.subgraph_url) as timer:
+            result = await self._query(query, variables)
+            timer.error = "errors" in result
+        return result
+
+    async def _query(self, query, variables):
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        if self.session is None:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_concurrency),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+        payload = self._payload(query, variables)
+        attempt = 0
+        while True:
+            try:
+                async with self.semaphore:
+                    async with self.session.post(
+                        self.subgraph_url, json=payload
+                    ) as request:
+                        if request.status == 200:
+                            return await request.json()
+                        error = self._status_error(request.status, query)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                error = e
+            await asyncio.sleep(self._retry_delay(error, attempt, query))
+            attempt += 1
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+
+async def paginate_subgraph_async(client, query, entity, where=None):
+    """Async generator version of paginate_subgraph."""
+    chunk_size = 1000  # max for subgraph = 1000
+    where = dict(where or {})
+    last_id = ""
+    while True:
+        result = await client.query(
+            query, {"first": chunk_size, "where": {**where, "id_gt": last_id}}
+        )
+        page = result["data"][entity]
+        if page:
+            yield page
+            last_id = page[-1]["id"]
+        if len(page) < chunk_size:
+            return
+
+
+async def get_all_interesting_prediction_contracts_async(
+    subgraph_url,
+    pairs=None,
+    timeframes=None,
+    sources=None,
+    owners=None,
+    where=None,
+    client=None,
+):
+    """Async get_all_interesting_prediction_contracts: the id space (or the
+    owner's nft batches) is split into ranges that are scanned concurrently,
+    and pages are decoded as they arrive. Raises on errors."""
+    own_client = client is None
+    if own_client:
+        client = AsyncSubgraphClient(subgraph_url)
+    try:
+        contract_filter = ContractFilter(pairs, timeframes, sources, owners)
+        where = dict(where or {})
+        if contract_filter.owners_filter:
+            nft_ids = []
+            async for page in paginate_subgraph_async(
+                client,
+                NFTS_QUERY,
+                "nfts",
+                {"owner_in": contract_filter.owners_filter},
+            ):
+                nft_ids.extend(nft["id"] for nft in page)
+            wheres = contract_filter.wheres_for_nfts(nft_ids, where)
+        else:
+            wheres = [
+                {**where, "id_gte": low, **({"id_lt": high} if high else {})}
+                for low, high in ID_RANGES
+            ]
+
+        contracts = {}
+
+        async def scan(range_where):
+            async for page in paginate_subgraph_async(
+                client, PREDICT_CONTRACTS_QUERY, "predictContracts", range_where
+            ):
+                for contract in page:
+                    info = contract_filter.decode(contract)
+                    if info is not None:
+                        contracts[contract["id"]] = info
+
+        await asyncio.gather(*(scan(range_where) for range_where in wheres))
+        # same (id) order as the sequential scan
+        return dict(sorted(contracts.items()))
+    finally:
+        if own_client:
+            await client.close()
@@ -0,0 +1,366 @@
+from concurrent.futures import Future
+
+import pytest
+import rlp
+from eth_abi import encode
+from web3 import Web3
+from web3.providers.base import BaseProvider
+
+from pdr_utils import contract as contract_module
+from pdr_utils.constants import SAPPHIRE_TESTNET_CHAINID
+from pdr_utils.contract import (
+    EPOCH_STATUS_PAYING,
+    EPOCH_STATUS_PENDING,
+    PredictorContract,
+    Web3Config,
+    is_claimable,
+)
+
+PRIVATE_KEY = "0x" + "ab" * 32
+STAKE_TOKEN = "0x" + "5a" * 20
+ALLOWANCE_SELECTOR = "0xdd62ed3e"
+APPROVE_SELECTOR = bytes.fromhex("095ea7b3")
+SUBMIT_SELECTOR = bytes.fromhex(
+    Web3.keccak(text="submitPredval(bool,uint256,uint256)").hex()[2:10]
+)
+
+
+def feed_address(n):
+    return "0x%040x" % (n + 1)
+
+
+class FakeNode(BaseProvider):
+    """An in-memory JSON-RPC node: answers what the wrappers ask and
+    records the raw transactions sent to it."""
+
+    def __init__(self, chain_id=8996, pending_count=0):
+        super().__init__()
+        self.chain_id = chain_id
+        self.pending_count = pending_count
+        self.allowance = 10**30
+        self.sent = []  # {"nonce", "to", "data", "hash"}
+        self.reject = {}  # nonce -> [error messages], one per send attempt
+
+    def make_request(self, method, params):
+        try:
+            result = getattr(self, method)(*params)
+        except ValueError as e:
+            return {"jsonrpc": "2.0", "id": 1, "error": {"code": -32000, "message": str(e)}}
+        return {"jsonrpc": "2.0", "id": 1, "result": result}
+
+    def eth_chainId(self):
+        return hex(self.chain_id)
+
+    def eth_getTransactionCount(self, address, block_identifier):
+        return hex(self.pending_count)
+
+    def eth_gasPrice(self):
+        return hex(10**9)
+
+    def eth_estimateGas(self, tx, block_identifier=None):
+        return hex(100000)
+
+    def eth_getCode(self, address, block_identifier):
+        return "0x"  # no Multicall3: reads go one by one
+
+    def eth_call(self, tx, block_identifier):
+        if tx["data"].startswith(ALLOWANCE_SELECTOR):
+            return "0x" + encode(["uint256"], [self.allowance]).hex()
+        raise ValueError("execution reverted")
+
+    def eth_sendRawTransaction(self, raw_tx):
+        raw = bytes.fromhex(raw_tx[2:])
+        fields = rlp.decode(raw)
+        nonce = int.from_bytes(fields[0], "big")
+        if self.reject.get(nonce):
+            raise ValueError(self.reject[nonce].pop(0))
+        tx_hash = Web3.keccak(raw).hex()
+        self.sent.append(
+            {"nonce": nonce, "to": "0x" + fields[3].hex(), "data": fields[5], "hash": tx_hash}
+        )
+        return tx_hash
+
+
+class FakeTracker:
+    """Receipt tracker resolving every transaction sent to `node` at once;
+    status 0 for those where revert(sent transaction) is true."""
+
+    def __init__(self, node):
+        self.node = node
+        self.revert = lambda tx: False
+
+    def track(self, tx_hash):
+        tx_hash = Web3.to_hex(tx_hash)
+        (tx,) = [tx for tx in self.node.sent if tx["hash"] == tx_hash]
+        future = Future()
+        future.set_result({"status": 0 if self.revert(tx) else 1})
+        return future
+
+    def start(self):
+        pass
+
+    def forget(self, tx_hash):
+        pass
+
+
+@pytest.fixture
+def node():
+    return FakeNode()
+
+
+@pytest.fixture
+def config(node):
+    config = Web3Config("http://node", PRIVATE_KEY)
+    config.w3.provider = node
+    config.gas_oracle.use_eip1559 = False
+    config._receipt_tracker = FakeTracker(node)
+    return config
+
+
+def make_feed(config, n=0):
+    feed = PredictorContract(config, feed_address(n))
+    feed.cache_param("stakeToken", STAKE_TOKEN)
+    return feed
+
+
+def test_failed_encrypted_send_gives_the_nonce_back(config, node, monkeypatch):
+    node.chain_id = SAPPHIRE_TESTNET_CHAINID
+    results = iter([(1, "insufficient funds"), (0, "0x" + "ee" * 32)])
+    nonces = []
+
+    def send_encrypted_tx(*args, nonce, **kwargs):
+        nonces.append(nonce)
+        return next(results)
+
+    monkeypatch.setattr(contract_module, "send_encrypted_tx", send_encrypted_tx)
+    feed = make_feed(config)
+    allowance = feed.token.tracked_allowance(feed.contract_address)
+
+    assert feed.submit_prediction(True, 1, 300, wait_for_receipt=False) is None
+    assert feed.token.tracked_allowance(feed.contract_address) == allowance
+    assert config.nonce_manager.in_flight() == []
+
+    txhash = feed.submit_prediction(True, 1, 300, wait_for_receipt=False)
+    assert txhash == "0x" + "ee" * 32
+    # the failed send's nonce was not skipped
+    assert nonces == [0, 0]
+    assert feed.token.tracked_allowance(feed.contract_address) == allowance - 10**18
+
+
+def test_failed_encrypted_send_in_submit_predictions(config, node, monkeypatch):
+    node.chain_id = SAPPHIRE_TESTNET_CHAINID
+    results = iter([(0, "0x" + "01" * 32), (2, "nonce too low"), (0, "0x" + "03" * 32)])
+    nonces = []
+
+    def send_encrypted_tx(*args, nonce, **kwargs):
+        nonces.append(nonce)
+        res, result = next(results)
+        if res == 0:
+            node.pending_count = nonce + 1
+        return res, result
+
+    monkeypatch.setattr(contract_module, "send_encrypted_tx", send_encrypted_tx)
+    feeds = [make_feed(config, n) for n in range(3)]
+
+    txhashes = contract_module.submit_predictions(
+        config, [(feed, True, 1, 300) for feed in feeds], wait_for_receipt=False
+    )
+
+    assert txhashes == ["0x" + "01" * 32, None, "0x" + "03" * 32]
+    # the nonce error resynced the counter from the chain
+    assert nonces == [0, 1, 1]
+    assert config.nonce_manager.in_flight() == []
+
+
+def sent_to(node, address):
+    return [tx for tx in node.sent if tx["to"] == address.lower()]
+
+
+def submissions(node):
+    return [tx for tx in node.sent if tx["data"][:4] == SUBMIT_SELECTOR]
+
+
+def test_feeds_whose_approval_fails_are_skipped(config, node):
+    node.allowance = 0
+    feeds = [make_feed(config, n) for n in range(3)]
+    bad = feeds[1].contract_address.lower()[2:]
+    config.receipt_tracker.revert = lambda tx: (
+        tx["data"][:4] == APPROVE_SELECTOR and bad in tx["data"].hex()
+    )
+
+    txhashes = contract_module.submit_predictions(
+        config,
+        [(feed, True, 1, 300) for feed in feeds] + [(feeds[1], False, 1, 600)],
+        wait_for_receipt=False,
+    )
+
+    assert txhashes[0] and txhashes[2]
+    assert txhashes[1] is None and txhashes[3] is None
+    assert [tx["to"] for tx in submissions(node)] == [
+        feeds[0].contract_address.lower(),
+        feeds[2].contract_address.lower(),
+    ]
+    # the optimistic allowance of the failed approval is dropped
+    assert not feeds[1].token.is_allowance_tracked(feeds[1].contract_address)
+    assert config.nonce_manager.in_flight() == []
+
+
+def test_ordered_broadcast_resigns_after_a_failure(config, node):
+    feeds = [make_feed(config, n) for n in range(4)]
+    node.reject[1] = ["insufficient funds for gas * price + value"]
+
+    txhashes = contract_module.submit_predictions(
+        config, [(feed, True, 1, 300) for feed in feeds], wait_for_receipt=False
+    )
+
+    assert txhashes[1] is None
+    assert txhashes[0] and txhashes[2] and txhashes[3]
+    # feeds 2 and 3 took the nonces following the last one sent, no gap
+    sent = submissions(node)
+    assert [tx["nonce"] for tx in sent] == [0, 1, 2]
+    assert [tx["to"] for tx in sent[1:]] == [
+        feeds[2].contract_address.lower(),
+        feeds[3].contract_address.lower(),
+    ]
+    assert [tx["hash"] for tx in sent] == [txhashes[0], txhashes[2], txhashes[3]]
+    assert config.nonce_manager.next_nonce() == 3
+
+
+def test_concurrent_broadcast_fills_the_gap(config, node):
+    feeds = [make_feed(config, n) for n in range(4)]
+    node.reject[1] = ["insufficient funds for gas * price + value"]
+
+    txhashes = contract_module.submit_predictions(
+        config,
+        [(feed, True, 1, 300) for feed in feeds],
+        wait_for_receipt=False,
+        ordered_broadcast=False,
+    )
+
+    assert txhashes[1] is None
+    assert txhashes[0] and txhashes[2] and txhashes[3]
+    (filler,) = sent_to(node, config.owner)
+    assert filler["nonce"] == 1
+    assert sorted(tx["nonce"] for tx in node.sent) == [0, 1, 2, 3]
+    assert config.nonce_manager.next_nonce() == 4
+
+
+def test_concurrent_broadcast_reports_stuck_transactions(config, node):
+    feeds = [make_feed(config, n) for n in range(4)]
+    node.reject[1] = ["insufficient funds for gas * price + value"] * 2
+
+    txhashes = contract_module.submit_predictions(
+        config,
+        [(feed, True, 1, 300) for feed in feeds],
+        wait_for_receipt=False,
+        ordered_broadcast=False,
+    )
+
+    # the gap could not be filled: 2 and 3 wait behind nonce 1
+    assert txhashes[0] and txhashes[1:] == [None, None, None]
+    assert sent_to(node, config.owner) == []
+    # the counter resyncs to the gap
+    node.pending_count = 1
+    assert config.nonce_manager.next_nonce() == 1
+
+
+EPOCH_STATUS_CANCELED = 2
+
+
+def test_is_claimable():
+    predictoor = "0x" + "11" * 20
+    right = (True, 10, predictoor, False)
+    wrong = (False, 10, predictoor, False)
+    paid = (True, 10, predictoor, True)
+
+    assert is_claimable(EPOCH_STATUS_PAYING, right, True)
+    assert not is_claimable(EPOCH_STATUS_PAYING, wrong, True)
+    assert not is_claimable(EPOCH_STATUS_PAYING, paid, True)
+    # payout refunds canceled and timed out slots, whatever the prediction
+    assert is_claimable(EPOCH_STATUS_CANCELED, wrong, None)
+    assert not is_claimable(EPOCH_STATUS_CANCELED, paid, None)
+    assert is_claimable(EPOCH_STATUS_PENDING, wrong, None)
+    # failed reads leave the slot in
+    assert is_claimable(EPOCH_STATUS_PAYING, None, None)
+    assert is_claimable(EPOCH_STATUS_PAYING, wrong, None)
+
+
+class FakeMulticall:
+    """Answers batch reads from `state`: function name -> slot -> result."""
+
+    def __init__(self, state):
+        self.state = state
+        self.calls = []
+
+    def call(self, reads):
+        self.calls.append([(fn_name, args[0]) for _, fn_name, args in reads])
+        return [self.state[fn_name].get(args[0]) for _, fn_name, args in reads]
+
+
+def make_payout_feed(config, monkeypatch):
+    feed = make_feed(config)
+    feed.cache_param("secondsPerEpoch", 300)
+    feed.cache_param("trueValSubmitTimeoutEpoch", 3)
+    monkeypatch.setattr(feed, "get_current_epoch", lambda: 100)  # at ts 30000
+    return feed
+
+
+def test_get_claimable_slots(config, monkeypatch):
+    feed = make_payout_feed(config, monkeypatch)
+
+    def prediction(predicted, paid=False):
+        return (predicted, 10, config.owner, paid)
+
+    slots = {
+        # slot: (submitted, status, getPrediction, trueValues)
+        26400: (True, EPOCH_STATUS_PAYING, prediction(True), None),
+        26700: (True, EPOCH_STATUS_PAYING, None, True),
+        27000: (True, EPOCH_STATUS_PAYING, prediction(True), True),
+        27300: (True, EPOCH_STATUS_PAYING, prediction(False), True),
+        27600: (True, EPOCH_STATUS_PAYING, prediction(True, paid=True), True),
+        27900: (True, EPOCH_STATUS_CANCELED, prediction(False), None),
+        28200: (False, EPOCH_STATUS_PAYING, None, True),
+        28500: (True, None, None, None),
+        28800: (True, EPOCH_STATUS_PENDING, prediction(False), None),
+        29400: (True, EPOCH_STATUS_PENDING, prediction(True), None),
+    }
+    multicall = FakeMulticall(
+        {
+            fn_name: {slot: values[i] for slot, values in slots.items()}
+            for i, fn_name in enumerate(
+                ("submittedPredval", "epochStatus", "getPrediction", "trueValues")
+            )
+        }
+    )
+    config._multicall = multicall
+
+    assert feed.get_claimable_slots(slots) == [26400, 26700, 27000, 27900, 28800]
+
+    # only submitted slots with a known status, past their trueval timeout
+    # if still pending, are read further; trueValues only for Paying ones
+    first, second = multicall.calls
+    assert len(first) == 2 * len(slots)
+    assert second == [
+        ("getPrediction", 26400),
+        ("trueValues", 26400),
+        ("getPrediction", 26700),
+        ("trueValues", 26700),
+        ("getPrediction", 27000),
+        ("trueValues", 27000),
+        ("getPrediction", 27300),
+        ("trueValues", 27300),
+        ("getPrediction", 27600),
+        ("trueValues", 27600),
+        ("getPrediction", 27900),
+        ("getPrediction", 28800),
+    ]
+
+
+def test_get_claimable_slots_skips_the_second_batch(config, monkeypatch):
+    feed = make_payout_feed(config, monkeypatch)
+    config._multicall = multicall = FakeMulticall(
+        {"submittedPredval": {}, "epochStatus": {}}
+    )
+    assert feed.get_claimable_slots([27000, 27300]) == []
+    assert len(multicall.calls) == 1
+    assert feed.get_claimable_slots([]) == []
@@ -0,0 +1,68 @@
+import asyncio
+
+from pdr_utils.contract_async import AsyncPredictorContract, AsyncWeb3Config
+
+PRIVATE_KEY = "0x" + "ab" * 32
+STAKE_TOKEN = "0x" + "5a" * 20
+
+
+def feed_address(n):
+    return "0x%040x" % (n + 1)
+
+
+def make_feed(config, n, stake_reads):
+    feed = AsyncPredictorContract(config, feed_address(n))
+
+    async def get_stake_token():
+        stake_reads.append(n)
+        await asyncio.sleep(0)
+        return STAKE_TOKEN
+
+    feed.get_stake_token = get_stake_token
+    return feed
+
+
+def test_feeds_share_one_token_per_address():
+    async def main():
+        config = AsyncWeb3Config("http://node", PRIVATE_KEY)
+        stake_reads = []
+        feeds = [make_feed(config, n, stake_reads) for n in range(2)]
+        tokens = await asyncio.gather(*[feed.get_token() for feed in feeds * 3])
+        return tokens, stake_reads
+
+    tokens, stake_reads = asyncio.run(main())
+
+    assert all(token is tokens[0] for token in tokens)
+    # each feed resolved its stake token once
+    assert sorted(stake_reads) == [0, 1]
+
+
+def test_concurrent_ensure_allowance_approves_once():
+    async def main():
+        config = AsyncWeb3Config("http://node", PRIVATE_KEY)
+        token = await config.get_token(STAKE_TOKEN)
+        approvals = []
+
+        async def allowance(account, spender):
+            await asyncio.sleep(0)
+            return 0
+
+        async def approve(spender, amount, wait_for_receipt=True):
+            approvals.append(amount)
+            await asyncio.sleep(0)
+            token._set_tracked_allowance(spender, amount)
+            return {"status": 1}
+
+        token.allowance = allowance
+        token.approve = approve
+        spender = feed_address(0)
+        results = await asyncio.gather(
+            *[token.ensure_allowance(spender, 10, budget=30) for _ in range(3)]
+        )
+        return results, approvals
+
+    results, approvals = asyncio.run(main())
+
+    assert results == [True, True, True]
+    # the later calls saw the first approval instead of overwriting it
+    assert approvals == [30]
@@ -0,0 +1,162 @@
+import json
+
+import pytest
+
+from pdr_utils import contract_registry
+from pdr_utils.contract_registry import ContractRegistry
+
+SUBGRAPH_URL = "http://subgraph"
+
+
+def contract(address, pair="BTC/USDT"):
+    return {"address": address, "pair": pair, "timeframe": "5m", "source": "binance"}
+
+
+class FakeSubgraph:
+    """Serves contracts with the block they were created at."""
+
+    def __init__(self):
+        self.block = 0
+        self.contracts = []  # (block, contract)
+        self.scans = []
+
+    def add(self, address, pair="BTC/USDT"):
+        self.block += 1
+        self.contracts.append((self.block, contract(address, pair)))
+
+    def get_subgraph_block(self, subgraph_url, client=None):
+        return self.block
+
+    def scan_prediction_contracts(self, subgraph_url, where=None, client=None, **filters):
+        self.scans.append((where, filters))
+        where = where or {}
+        # like ContractFilter: comma-separated, feeds without a pair pass
+        pairs = filters.get("pairs")
+        return {
+            contract["address"]: dict(contract)
+            for block, contract in self.contracts
+            if block > where.get("block_gt", 0)
+            and ("id_in" not in where or contract["address"] in where["id_in"])
+            and not (pairs and contract["pair"] and contract["pair"] not in pairs.split(","))
+        }
+
+
+@pytest.fixture
+def subgraph(monkeypatch):
+    fake = FakeSubgraph()
+    monkeypatch.setattr(contract_registry, "get_subgraph_block", fake.get_subgraph_block)
+    monkeypatch.setattr(
+        contract_registry, "scan_prediction_contracts", fake.scan_prediction_contracts
+    )
+    return fake
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "contracts.jsonl")
+
+
+def test_first_sync_is_full_and_saved(subgraph, path):
+    subgraph.add("0xa")
+    subgraph.add("0xb")
+    registry = ContractRegistry(path, SUBGRAPH_URL, pairs="BTC/USDT")
+
+    assert set(registry.sync()) == {"0xa", "0xb"}
+
+    assert subgraph.scans[0][0] is None
+    assert subgraph.scans[0][1]["pairs"] == "BTC/USDT"
+    with open(path) as f:
+        header = json.loads(f.readline())
+        rows = [json.loads(line) for line in f]
+    assert header["block"] == 2 and header["subgraph_url"] == SUBGRAPH_URL
+    assert [row["address"] for row in rows] == ["0xa", "0xb"]
+
+
+def test_restart_only_fetches_the_delta(subgraph, path):
+    subgraph.add("0xa")
+    ContractRegistry(path, SUBGRAPH_URL).sync()
+    subgraph.add("0xb")
+
+    registry = ContractRegistry(path, SUBGRAPH_URL)
+    assert set(registry.contracts) == {"0xa"}
+    assert set(registry.sync()) == {"0xa", "0xb"}
+    assert subgraph.scans[-1][0] == {"block_gt": 1}
+    assert registry.block == 2
+
+
+def test_no_new_block_skips_the_scan(subgraph, path):
+    subgraph.add("0xa")
+    registry = ContractRegistry(path, SUBGRAPH_URL)
+    registry.sync()
+    registry.sync()
+    assert len(subgraph.scans) == 1
+
+
+def test_delta_merges_by_address(subgraph, path):
+    subgraph.add("0xa")
+    registry = ContractRegistry(path, SUBGRAPH_URL)
+    registry.sync()
+    # indexed again in a later block, e.g. after a reorg: updated in place
+    subgraph.contracts.append((2, contract("0xa", "ETH/USDT")))
+    subgraph.block = 2
+    assert registry.sync() == {"0xa": contract("0xa", "ETH/USDT")}
+
+
+def test_contracts_without_info_are_fetched_again(subgraph, path):
+    subgraph.add("0xa", pair=None)
+    subgraph.add("0xb", pair=None)
+    subgraph.add("0xc")
+    registry = ContractRegistry(path, SUBGRAPH_URL, pairs="BTC/USDT")
+    registry.sync()
+    assert registry.incomplete() == ["0xa", "0xb"]
+
+    # nftData set later: the feed's block, and so the delta, do not change
+    subgraph.contracts[0][1]["pair"] = "BTC/USDT"
+    subgraph.contracts[1][1]["pair"] = "ETH/USDT"
+    subgraph.add("0xd")
+
+    assert registry.sync() == {
+        address: contract(address) for address in ("0xa", "0xc", "0xd")
+    }
+    assert [where for where, _ in subgraph.scans[1:]] == [
+        {"id_in": ["0xa", "0xb"]},
+        {"block_gt": 3},
+    ]
+    assert registry.incomplete() == []
+    # complete snapshots only fetch the delta
+    subgraph.add("0xe")
+    registry.sync()
+    assert [where for where, _ in subgraph.scans[3:]] == [{"block_gt": 4}]
+
+
+def test_full_sync_drops_contracts_gone_from_the_subgraph(subgraph, path):
+    subgraph.add("0xa")
+    subgraph.add("0xb")
+    registry = ContractRegistry(path, SUBGRAPH_URL)
+    registry.sync()
+    subgraph.contracts.pop(0)
+    subgraph.block += 1
+    assert set(registry.sync(full=True)) == {"0xb"}
+    assert subgraph.scans[-1][0] is None
+
+
+def test_snapshot_with_other_filters_or_subgraph_is_ignored(subgraph, path):
+    subgraph.add("0xa")
+    ContractRegistry(path, SUBGRAPH_URL, pairs="BTC/USDT").sync()
+
+    for registry in (
+        ContractRegistry(path, SUBGRAPH_URL, pairs="ETH/USDT"),
+        ContractRegistry(path, "http://other-subgraph", pairs="BTC/USDT"),
+    ):
+        assert registry.contracts == {} and registry.block is None
+    assert ContractRegistry(path, SUBGRAPH_URL, pairs="BTC/USDT").block == 1
+
+
+def test_corrupt_snapshot_is_ignored(subgraph, path):
+    with open(path, "w") as f:
+        f.write("{not json\n")
+    registry = ContractRegistry(path, SUBGRAPH_URL)
+    assert not registry.load()
+    subgraph.add("0xa")
+    assert set(registry.sync()) == {"0xa"}
+    assert subgraph.scans[0][0] is None
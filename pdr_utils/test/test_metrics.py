@@ -0,0 +1,101 @@
+import pytest
+
+from pdr_utils import metrics as metrics_module
+from pdr_utils.metrics import Metrics, query_name, rpc_middleware
+
+
+def test_snapshot_counts_errors_retries_and_buckets():
+    metrics = Metrics(enabled=True, buckets=(0.1, 1.0))
+    metrics.observe("rpc", "eth_call", "a", 0.05)
+    metrics.observe("rpc", "eth_call", "a", 0.5, error=True)
+    metrics.observe("rpc", "eth_call", "a", 3.0)
+    metrics.retry("rpc", "eth_call", "a")
+
+    (series,) = metrics.snapshot()
+
+    assert series["kind"] == "rpc" and series["method"] == "eth_call"
+    assert series["count"] == 3
+    assert series["errors"] == 1
+    assert series["retries"] == 1
+    assert series["latency_sum"] == pytest.approx(3.55)
+    assert series["latency_avg"] == pytest.approx(3.55 / 3)
+    assert series["buckets"] == [(0.1, 1), (1.0, 2), (float("inf"), 3)]
+
+
+def test_retry_only_series_has_no_average():
+    metrics = Metrics(enabled=True)
+    metrics.retry("rpc_endpoint", "eth_call", "b")
+    (series,) = metrics.snapshot()
+    assert series["count"] == 0 and series["latency_avg"] is None
+
+
+def test_timer_counts_exceptions_as_errors():
+    metrics = Metrics(enabled=True)
+    with metrics.timer("subgraph", "predictContracts", "url"):
+        pass
+    with pytest.raises(ValueError):
+        with metrics.timer("subgraph", "predictContracts", "url"):
+            raise ValueError("boom")
+    (series,) = metrics.snapshot()
+    assert series["count"] == 2 and series["errors"] == 1
+
+
+def test_reset_clears_all_series():
+    metrics = Metrics(enabled=True)
+    metrics.observe("rpc", "eth_call", "a", 0.1)
+    metrics.reset()
+    assert metrics.snapshot() == []
+
+
+def test_prometheus_families_are_contiguous():
+    metrics = Metrics(enabled=True, buckets=(0.1,))
+    metrics.observe("rpc", "eth_call", "a", 0.05)
+    metrics.observe("subgraph", 'q"1', "b", 0.2, error=True)
+
+    lines = metrics.to_prometheus().splitlines()
+
+    families = []
+    for line in lines:
+        if line.startswith("# TYPE "):
+            families.append((line.split()[2], []))
+        else:
+            families[-1][1].append(line)
+    assert [name for name, _ in families] == [
+        "pdr_requests_total",
+        "pdr_request_errors_total",
+        "pdr_request_retries_total",
+        "pdr_request_latency_seconds",
+    ]
+    for name, samples in families:
+        assert samples and all(sample.startswith(name) for sample in samples)
+    assert 'pdr_request_errors_total{kind="subgraph",method="q\\"1",endpoint="b"} 1' in lines
+    assert (
+        'pdr_request_latency_seconds_bucket{kind="rpc",method="eth_call",'
+        'endpoint="a",le="+Inf"} 1'
+    ) in lines
+    assert len(families[3][1]) == 2 * (2 + 2)  # 2 buckets, sum and count per series
+
+
+def test_query_name():
+    assert query_name("query { predictContracts(first: 10) { id } }") == "predictContracts"
+    assert query_name("query Nfts($where: Nft_filter) { nfts { id } }") == "nfts"
+    assert query_name("") == "query"
+
+
+def test_rpc_middleware_records_only_when_enabled(monkeypatch):
+    metrics = Metrics(enabled=False)
+    monkeypatch.setattr(metrics_module, "metrics", metrics)
+    responses = iter([{"result": "0x1"}, {"result": "0x1"}, {"error": {"code": 3}}])
+    middleware = rpc_middleware("http://node", lambda method, params: f"{method}:x")(
+        lambda method, params: next(responses), None
+    )
+
+    middleware("eth_call", [])
+    assert metrics.snapshot() == []
+
+    metrics.enable()
+    middleware("eth_call", [])
+    middleware("eth_call", [])
+    (series,) = metrics.snapshot()
+    assert (series["method"], series["endpoint"]) == ("eth_call:x", "http://node")
+    assert series["count"] == 2 and series["errors"] == 1
@@ -0,0 +1,194 @@
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from types import SimpleNamespace
+
+import pytest
+from web3 import HTTPProvider
+from web3.exceptions import TransactionNotFound
+
+from pdr_utils.receipt_tracker import ReceiptTracker
+
+TX1 = "0x" + "11" * 32
+TX2 = "0x" + "22" * 32
+TX3 = "0x" + "33" * 32
+
+
+def raw_receipt(tx_hash, status=1):
+    return {
+        "transactionHash": tx_hash,
+        "blockNumber": "0x5",
+        "status": hex(status),
+        "gasUsed": "0x5208",
+        "logs": [],
+    }
+
+
+class FakeEth:
+    def __init__(self):
+        self.block_number = 5
+        self.receipts = {}
+        self.receipt_reads = []
+
+    def get_transaction_receipt(self, tx_hash):
+        self.receipt_reads.append(tx_hash)
+        if tx_hash not in self.receipts:
+            raise TransactionNotFound(tx_hash)
+        return self.receipts[tx_hash]
+
+
+def make_tracker(mined, **kwargs):
+    """A tracker whose batch endpoint knows the receipts in `mined`."""
+    eth = FakeEth()
+    config = SimpleNamespace(
+        w3=SimpleNamespace(eth=eth, provider=HTTPProvider("http://node"))
+    )
+    tracker = ReceiptTracker(config, **kwargs)
+    batches = []
+
+    def post(url, payload):
+        batches.append(payload)
+        return [
+            {
+                "jsonrpc": "2.0",
+                "id": request["id"],
+                "result": mined.get(request["params"][0]),
+            }
+            for request in reversed(payload)  # batch answers may come in any order
+        ]
+
+    tracker._post = post
+    return tracker, eth, batches
+
+
+def test_one_batch_resolves_all_mined_transactions():
+    tracker, _, batches = make_tracker(
+        {TX1: raw_receipt(TX1), TX3: raw_receipt(TX3, status=0)}
+    )
+    seen = []
+    futures = [tracker.track(TX1, seen.append), tracker.track(TX2), tracker.track(TX3)]
+
+    assert tracker.poll() == 2
+
+    assert len(batches) == 1
+    assert [r["params"] for r in batches[0]] == [[TX1], [TX2], [TX3]]
+    receipt = futures[0].result(0)
+    assert receipt.status == 1 and receipt.blockNumber == 5
+    assert futures[2].result(0).status == 0
+    assert not futures[1].done()
+    assert seen == [receipt]
+    assert tracker.pending() == [TX2]
+
+
+def test_polls_once_per_block_unless_forced():
+    tracker, eth, batches = make_tracker({})
+    tracker.track(TX1)
+    tracker.poll()
+    tracker.poll()
+    assert len(batches) == 1
+    tracker.poll(force=True)
+    eth.block_number += 1
+    tracker.poll()
+    assert len(batches) == 3
+
+
+def test_batches_are_split_by_batch_size():
+    tracker, _, batches = make_tracker({}, batch_size=2)
+    for tx_hash in (TX1, TX2, TX3):
+        tracker.track(tx_hash)
+    tracker.poll()
+    assert [len(batch) for batch in batches] == [2, 1]
+
+
+def test_hashes_are_normalized():
+    tracker, _, _ = make_tracker({})
+    future = tracker.track(bytes.fromhex(TX1[2:]))
+    assert tracker.track(TX1.upper().replace("0X", "")) is future
+    assert tracker.pending() == [TX1]
+
+
+def test_falls_back_to_single_requests_without_batch_support():
+    tracker, eth, batches = make_tracker({})
+    tracker._post = lambda url, payload: batches.append(payload) or {
+        "jsonrpc": "2.0",
+        "id": None,
+        "error": {"code": -32600, "message": "batch requests are not supported"},
+    }
+    eth.receipts[TX1] = {"status": 1}
+    future1, future2 = tracker.track(TX1), tracker.track(TX2)
+
+    assert tracker.poll() == 1
+    assert future1.result(0) == {"status": 1}
+    assert not future2.done()
+
+    eth.block_number += 1
+    tracker.poll()
+    # batches are not tried again once rejected
+    assert len(batches) == 1
+    assert eth.receipt_reads == [TX1, TX2, TX2]
+
+
+def test_failed_batch_falls_back_for_this_poll():
+    tracker, eth, batches = make_tracker({})
+
+    def fail(url, payload):
+        batches.append(payload)
+        raise ConnectionError("reset by peer")
+
+    tracker._post = fail
+    eth.receipts[TX1] = {"status": 1}
+    future = tracker.track(TX1)
+    assert tracker.poll() == 1
+    assert future.result(0) == {"status": 1}
+    assert tracker._batch_supported
+
+
+def test_stuck_transactions_are_reported_once_then_dropped():
+    stuck = []
+    tracker, _, _ = make_tracker(
+        {}, stuck_after=10, drop_after=20, on_stuck=lambda *args: stuck.append(args)
+    )
+    future = tracker.track(TX1)
+    entry = tracker._pending[TX1]
+
+    entry[2] -= 15  # pending for 15 s
+    assert list(tracker.stuck()) == [TX1]
+    tracker.poll(force=True)
+    tracker.poll(force=True)
+    assert [tx_hash for tx_hash, _ in stuck] == [TX1]
+    assert stuck[0][1] >= 15
+
+    entry[2] -= 10  # pending for 25 s
+    tracker.poll(force=True)
+    assert tracker.pending() == []
+    with pytest.raises(TimeoutError):
+        future.result(0)
+
+
+def test_failing_callback_does_not_stop_the_others():
+    tracker, _, _ = make_tracker({TX1: raw_receipt(TX1), TX2: raw_receipt(TX2)})
+    seen = []
+
+    def fail(receipt):
+        raise ValueError("callback bug")
+
+    tracker.track(TX1, fail)
+    tracker.track(TX2, seen.append)
+    assert tracker.poll() == 2
+    assert len(seen) == 1
+
+
+def test_wait_forgets_on_timeout():
+    tracker, _, _ = make_tracker({}, poll_interval=60)
+    try:
+        with pytest.raises(FutureTimeoutError):
+            tracker.wait(TX1, timeout=0.01)
+        assert tracker.pending() == []
+    finally:
+        tracker.stop()
+
+
+def test_forget_cancels_the_future():
+    tracker, _, _ = make_tracker({TX1: raw_receipt(TX1)})
+    future = tracker.track(TX1)
+    tracker.forget(TX1)
+    assert future.cancelled()
+    assert tracker.poll() == 0
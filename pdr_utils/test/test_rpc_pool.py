@@ -0,0 +1,153 @@
+import pytest
+from requests.exceptions import ConnectionError as RequestsConnectionError
+from requests.exceptions import ConnectTimeout, ReadTimeout
+
+from pdr_utils.rpc_pool import RPCPool
+
+
+class FakeProvider:
+    """Stands in for an endpoint's HTTPProvider."""
+
+    def __init__(self, name, block_number=100):
+        self.name = name
+        self.block_number = block_number
+        self.calls = []
+        self.fail = False
+        self.raises = None
+        self.error = None
+
+    def make_request(self, method, params):
+        self.calls.append(method)
+        if self.fail:
+            raise RequestsConnectionError(f"{self.name} is down")
+        if self.raises is not None:
+            raise self.raises
+        if self.error is not None:
+            return {"jsonrpc": "2.0", "id": 1, "error": self.error}
+        if method == "eth_blockNumber":
+            return {"jsonrpc": "2.0", "id": 1, "result": hex(self.block_number)}
+        return {"jsonrpc": "2.0", "id": 1, "result": self.name}
+
+
+def make_pool(n=3, **kwargs):
+    pool = RPCPool([f"http://rpc{i}" for i in range(n)], **kwargs)
+    providers = []
+    for i, endpoint in enumerate(pool.endpoints):
+        endpoint.provider = FakeProvider(f"rpc{i}")
+        providers.append(endpoint.provider)
+    return pool, providers
+
+
+def test_rejects_bad_arguments():
+    with pytest.raises(ValueError):
+        RPCPool([])
+    with pytest.raises(ValueError):
+        RPCPool(["http://rpc0"], strategy="random")
+
+
+def test_round_robin_spreads_reads():
+    pool, providers = make_pool(strategy="round_robin")
+    results = [pool.make_request("eth_call", [])["result"] for _ in range(6)]
+    assert results == ["rpc0", "rpc1", "rpc2"] * 2
+
+
+def test_least_latency_prefers_the_fastest_endpoint():
+    pool, _ = make_pool()
+    for endpoint, latency in zip(pool.endpoints, (0.3, 0.1, 0.2)):
+        endpoint.latency = latency
+    # the fakes answer instantly, so rpc1 only gets faster
+    assert {pool.make_request("eth_call", [])["result"] for _ in range(5)} == {"rpc1"}
+
+
+def test_sticky_methods_stay_on_the_write_endpoint():
+    pool, providers = make_pool(strategy="round_robin")
+    for method in ("eth_getTransactionCount", "eth_sendRawTransaction"):
+        for _ in range(3):
+            assert pool.make_request(method, [])["result"] == "rpc0"
+    assert providers[1].calls == providers[2].calls == []
+
+
+def test_failover_with_exponential_cooldown():
+    pool, providers = make_pool(strategy="round_robin", cooldown=10, max_cooldown=15)
+    providers[0].fail = True
+
+    assert pool.make_request("eth_sendRawTransaction", [])["result"] == "rpc1"
+    # the write endpoint moved with the failover
+    assert pool.write_endpoint is pool.endpoints[1]
+    down = pool.endpoints[0]
+    assert not down.is_healthy()
+    assert down.errors == 1
+
+    # a cooling down endpoint is not picked for reads
+    results = {pool.make_request("eth_call", [])["result"] for _ in range(4)}
+    assert results == {"rpc1", "rpc2"}
+    assert providers[0].calls == ["eth_sendRawTransaction"]
+
+    first_cooldown = down.down_until
+    down.down_until = 0.0
+    pool.make_request("eth_sendRawTransaction", [])  # still on rpc1
+    providers[1].fail = True
+    providers[2].fail = True
+    with pytest.raises(RequestsConnectionError):
+        pool.make_request("eth_call", [])
+    # consecutive failures double the cooldown, up to max_cooldown
+    assert down.failures == 2
+    assert down.down_until - first_cooldown > 4
+
+
+def test_send_is_not_rebroadcast_after_a_read_timeout():
+    pool, providers = make_pool(strategy="round_robin")
+    providers[0].raises = ReadTimeout("read timed out")
+
+    # the node may have the transaction already: no retry elsewhere
+    with pytest.raises(ReadTimeout):
+        pool.make_request("eth_sendRawTransaction", ["0x01"])
+    assert providers[1].calls == providers[2].calls == []
+    assert not pool.endpoints[0].is_healthy()
+
+    # reads still fail over on the same error
+    assert pool.make_request("eth_call", [])["result"] in ("rpc1", "rpc2")
+
+
+def test_send_fails_over_when_the_connection_failed():
+    pool, providers = make_pool(strategy="round_robin")
+    providers[0].raises = ConnectTimeout("connect timed out")
+    assert pool.make_request("eth_sendRawTransaction", ["0x01"])["result"] == "rpc1"
+    assert pool.write_endpoint is pool.endpoints[1]
+
+
+def test_rate_limited_requests_are_retried_elsewhere():
+    pool, providers = make_pool(strategy="round_robin")
+    providers[0].error = {"code": 429, "message": "Too Many Requests"}
+    assert pool.make_request("eth_call", [])["result"] == "rpc1"
+    assert not pool.endpoints[0].is_healthy()
+
+
+def test_other_errors_are_returned_as_is():
+    pool, providers = make_pool(strategy="round_robin")
+    providers[0].error = {"code": -32000, "message": "execution reverted"}
+    response = pool.make_request("eth_call", [])
+    assert response["error"]["message"] == "execution reverted"
+    assert providers[1].calls == []
+    assert pool.endpoints[0].is_healthy()
+
+
+def test_all_rate_limited_returns_the_last_error():
+    pool, providers = make_pool(2)
+    for provider in providers:
+        provider.error = {"code": -32005, "message": "limit exceeded"}
+    assert pool.make_request("eth_call", [])["error"]["code"] == -32005
+
+
+def test_health_check_revives_and_marks_lagging_endpoints():
+    pool, providers = make_pool(max_block_lag=5)
+    pool.endpoints[0].down_until = float("inf")
+    providers[2].block_number = 90
+
+    pool.check_health()
+
+    assert [e.block_number for e in pool.endpoints] == [100, 100, 90]
+    assert pool.endpoints[0].is_healthy()
+    assert pool.endpoints[1].is_healthy()
+    assert not pool.endpoints[2].is_healthy()
+    assert [s["healthy"] for s in pool.stats()] == [True, True, False]
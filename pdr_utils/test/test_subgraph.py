@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+import requests
+
+from pdr_utils.subgraph import SubgraphClient
+from pdr_utils.subgraph_async import AsyncSubgraphClient
+
+QUERY = "query { predictContracts { id } }"
+RESULT = {"data": {"predictContracts": []}}
+
+
+class FakeResponse:
+    def __init__(self, status):
+        self.status_code = self.status = status
+
+    def json(self):
+        return RESULT
+
+
+class FakeAsyncResponse(FakeResponse):
+    async def json(self):
+        return RESULT
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+
+class FakeSession:
+    """Answers posts from `responses`: a status code or an exception."""
+
+    def __init__(self, responses, response_class=FakeResponse):
+        self.responses = list(responses)
+        self.response_class = response_class
+        self.posts = 0
+
+    def post(self, url, json, timeout=None):
+        self.posts += 1
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return self.response_class(response)
+
+
+def make_client(responses, **kwargs):
+    client = SubgraphClient("http://subgraph", backoff_factor=0, **kwargs)
+    client.session = FakeSession(responses)
+    return client
+
+
+def test_transient_failures_are_retried():
+    client = make_client([requests.ConnectionError("reset"), 503, 200])
+    assert client.query(QUERY) == RESULT
+    assert client.session.posts == 3
+
+
+def test_other_status_codes_raise_at_once():
+    client = make_client([400, 200])
+    with pytest.raises(Exception, match="Return code is 400"):
+        client.query(QUERY)
+    assert client.session.posts == 1
+
+
+def test_retries_are_bounded():
+    client = make_client([503] * 3, max_retries=2)
+    with pytest.raises(Exception, match="Return code is 503"):
+        client.query(QUERY)
+    assert client.session.posts == 3
+
+
+def test_backoff_is_capped():
+    client = SubgraphClient("http://subgraph", backoff_factor=1, max_backoff=2)
+    assert all(0 <= client.backoff(attempt) <= 2 for attempt in range(10))
+
+
+def test_async_client_can_be_built_outside_its_loop():
+    # built before the loop that runs it, e.g. at import time
+    client = AsyncSubgraphClient("http://subgraph", backoff_factor=0)
+    client.session = FakeSession([503, 200], FakeAsyncResponse)
+    assert client.semaphore is None
+
+    async def main():
+        return await client.query(QUERY)
+
+    assert asyncio.run(main()) == RESULT
+    assert client.session.posts == 2
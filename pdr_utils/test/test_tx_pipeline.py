@@ -0,0 +1,125 @@
+from concurrent.futures import Future
+from types import SimpleNamespace
+
+from pdr_utils.tx_pipeline import NonceManager, TxPipeline, is_nonce_error
+
+
+class FakeEth:
+    def __init__(self, pending_count):
+        self.pending_count = pending_count
+        self.reads = 0
+
+    def get_transaction_count(self, address, block_identifier):
+        assert block_identifier == "pending"
+        self.reads += 1
+        return self.pending_count
+
+
+def make_manager(pending_count=7):
+    eth = FakeEth(pending_count)
+    return NonceManager(SimpleNamespace(eth=eth), "0xowner"), eth
+
+
+def test_nonces_are_consecutive_after_one_read():
+    manager, eth = make_manager()
+    assert [manager.next_nonce() for _ in range(3)] == [7, 8, 9]
+    assert eth.reads == 1
+    assert manager.in_flight() == [7, 8, 9]
+
+
+def test_sent_nonces_leave_flight_without_resync():
+    manager, eth = make_manager()
+    nonce = manager.next_nonce()
+    manager.sent(nonce)
+    assert manager.in_flight() == []
+    assert manager.next_nonce() == 8
+    assert eth.reads == 1
+
+
+def test_release_of_last_nonce_hands_it_out_again():
+    manager, eth = make_manager()
+    first = manager.next_nonce()
+    last = manager.next_nonce()
+    manager.release(last)
+    assert manager.next_nonce() == last
+    assert manager.in_flight() == [first, last]
+    assert eth.reads == 1
+
+
+def test_release_below_others_in_flight_waits_to_resync():
+    manager, eth = make_manager()
+    gap, later = manager.next_nonce(), manager.next_nonce()
+    manager.release(gap)
+    # `later` is still held: resyncing now could hand it out twice
+    assert manager.next_nonce() == 9
+    assert eth.reads == 1
+
+    manager.sent(later)
+    manager.sent(9)
+    eth.pending_count = 7  # the chain stops at the gap
+    assert manager.next_nonce() == 7
+    assert eth.reads == 2
+
+
+def test_pre_broadcast_failure_does_not_resync():
+    manager, eth = make_manager()
+    held = manager.next_nonce()
+    failed = manager.next_nonce()
+    manager.failed(failed, ValueError("execution reverted"))
+    assert manager.next_nonce() == failed
+    assert held in manager.in_flight()
+    assert eth.reads == 1
+
+
+def test_nonce_error_resyncs_once_idle():
+    manager, eth = make_manager()
+    held = manager.next_nonce()
+    failed = manager.next_nonce()
+    manager.failed(failed, ValueError("nonce too low: next nonce 12"))
+    assert manager.next_nonce() == 9
+    assert eth.reads == 1
+
+    manager.sent(held)
+    manager.sent(9)
+    eth.pending_count = 12
+    assert manager.next_nonce() == 12
+    assert eth.reads == 2
+
+
+def test_is_nonce_error():
+    assert is_nonce_error(ValueError({"message": "Nonce too low"}))
+    assert is_nonce_error(ValueError("already known"))
+    assert is_nonce_error(ValueError("replacement transaction underpriced"))
+    assert not is_nonce_error(ValueError("execution reverted"))
+    assert not is_nonce_error(ValueError("insufficient funds for gas"))
+
+
+class FakeTracker:
+    def __init__(self, receipts):
+        self.receipts = receipts
+        self.forgotten = []
+
+    def track(self, tx_hash):
+        future = Future()
+        if tx_hash in self.receipts:
+            future.set_result(self.receipts[tx_hash])
+        return future
+
+    def start(self):
+        pass
+
+    def forget(self, tx_hash):
+        self.forgotten.append(tx_hash)
+
+
+def test_pipeline_returns_receipts_in_order_and_forgets_timeouts():
+    tracker = FakeTracker({"0x01": {"status": 1}, "0x03": {"status": 0}})
+    pipeline = TxPipeline(SimpleNamespace(receipt_tracker=tracker), timeout=0.01)
+    for tx_hash in ("0x01", None, "0x02", "0x03"):
+        pipeline.add(tx_hash)
+
+    receipts = pipeline.wait_for_receipts()
+
+    assert receipts == [{"status": 1}, None, None, {"status": 0}]
+    assert tracker.forgotten == ["0x02"]
+    assert pipeline.tx_hashes == []
@@ -0,0 +1,174 @@
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+logger = logging.getLogger(__name__)
+
+
+# fragments of node errors meaning the nonce was wrong, not the transaction
+NONCE_ERRORS = (
+    "nonce too low",
+    "nonce too high",
+    "invalid nonce",
+    "already known",
+    "replacement transaction underpriced",
+)
+
+
+def is_nonce_error(error):
+    """Whether a send failed because of its nonce, see NONCE_ERRORS."""
+    message = str(error).lower()
+    return any(fragment in message for fragment in NONCE_ERRORS)
+
+
+class NonceManager:
+    """Allocates transaction nonces for one account locally.
+
+    The first nonce is read from the chain (pending count); after that
+    nonces are handed out from a counter, so transactions can be sent
+    back-to-back from any thread without waiting for the previous one.
+
+    Each allocated nonce is in flight until the caller reports it with
+    sent() once broadcast, or with release() if it never was: a released
+    nonce is handed out again if it is still the last one allocated,
+    otherwise it leaves a gap. After a gap or a nonce error (reset()) the
+    counter is resynced from the chain, but only once no allocated nonce is
+    in flight, so that other senders' nonces are never handed out twice.
+    """
+
+    def __init__(self, w3, address):
+        self.w3 = w3
+        self.address = address
+        self._lock = threading.Lock()
+        self._next_nonce = None
+        self._in_flight = set()
+        self._resync = False
+
+    def next_nonce(self):
+        with self._lock:
+            if self._next_nonce is None:
+                self._next_nonce = self.w3.eth.get_transaction_count(
+                    self.address, "pending"
+                )
+            return self._allocate()
+
+    def _allocate(self):
+        nonce = self._next_nonce
+        self._next_nonce += 1
+        self._in_flight.add(nonce)
+        return nonce
+
+    def sent(self, nonce):
+        """Records that the transaction with `nonce` was broadcast."""
+        with self._lock:
+            self._in_flight.discard(nonce)
+            self._resync_if_idle()
+
+    def release(self, nonce):
+        """Gives back a nonce whose transaction was not broadcast."""
+        with self._lock:
+            self._in_flight.discard(nonce)
+            if self._next_nonce is not None and nonce == self._next_nonce - 1:
+                self._next_nonce = nonce
+            else:
+                # later nonces are out: resync to fill the gap
+                self._resync = True
+            self._resync_if_idle()
+
+    def reset(self, nonce=None):
+        """Resyncs from the chain once nothing is in flight, e.g. after a
+        nonce error; `nonce` is the failed transaction's, if allocated here."""
+        with self._lock:
+            self._in_flight.discard(nonce)
+            self._resync = True
+            self._resync_if_idle()
+
+    def failed(self, nonce, error):
+        """Records a failed send: reset() on nonce errors, else release()."""
+        if is_nonce_error(error):
+            self.reset(nonce)
+        else:
+            self.release(nonce)
+
+    def in_flight(self):
+        with self._lock:
+            return sorted(self._in_flight)
+
+    def _resync_if_idle(self):
+        if self._resync and not self._in_flight:
+            self._next_nonce = None
+            self._resync = False
+
+
+class AsyncNonceManager(NonceManager):
+    """NonceManager for an AsyncWeb3 connection, safe across tasks."""
+
+    def __init__(self, w3, address):
+        super().__init__(w3, address)
+        self._async_lock = None
+
+    async def next_nonce(self):
+        if self._async_lock is None:
+            self._async_lock = asyncio.Lock()
+        async with self._async_lock:
+            if self._next_nonce is None:
+                count = await self.w3.eth.get_transaction_count(
+                    self.address, "pending"
+                )
+                with self._lock:
+                    if self._next_nonce is None:
+                        self._next_nonce = count
+            with self._lock:
+                return self._allocate()
+
+
+class TxPipeline:
+    """Fires transactions back-to-back, then gathers receipts concurrently.
+
+    Usage:
+        pipeline = TxPipeline(config)
+        for feed in feeds:
+            pipeline.submit(feed.submit_prediction, True, 1, ts, wait_for_receipt=False)
+        receipts = pipeline.wait_for_receipts()
+    """
+
+    def __init__(self, config, timeout=120):
+        self.config = config
+        self.timeout = timeout
+        self.tx_hashes = []
+
+    def submit(self, send_fn, *args, **kwargs):
+        """Calls a wrapper write method that returns a tx hash (i.e. with
+        wait_for_receipt=False) and queues the hash; returns it."""
+        return self.add(send_fn(*args, **kwargs))
+
+    def add(self, tx_hash):
+        """Queues an already sent transaction; returns its hash."""
+        self.tx_hashes.append(tx_hash)
+        return tx_hash
+
+    def wait_for_receipts(self):
+        """Returns the receipts of all submitted transactions, in order;
+        None for sends that failed or receipts that timed out. Receipts are
+        followed by the connection's ReceiptTracker, one batch per block."""
+        tx_hashes, self.tx_hashes = self.tx_hashes, []
+        tracker = self.config.receipt_tracker
+        futures = [None if h is None else tracker.track(h) for h in tx_hashes]
+        tracker.start()
+        deadline = time.monotonic() + self.timeout
+        receipts = []
+        for tx_hash, future in zip(tx_hashes, futures):
+            try:
+                receipts.append(
+                    future and future.result(max(0, deadline - time.monotonic()))
+                )
+            except FutureTimeoutError:
+                logger.warning("Receipt of %s timed out", tx_hash)
+                tracker.forget(tx_hash)
+                receipts.append(None)
+            except Exception as e:
+                logger.warning("Waiting for a receipt failed: %s", e)
+                receipts.append(None)
+        return receipts
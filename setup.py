@@ -13,6 +13,7 @@ install_requirements = [
     "pylint",
     "bumpversion",
     "requests",
+    "aiohttp",
     "web3",
     "coverage",
     "eth-account",